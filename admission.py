@@ -0,0 +1,199 @@
+import math
+import os
+import re
+import threading
+import time
+
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+
+from metrics import metrics
+from selection import page_indices
+
+
+def _env(name, default, type=int):
+    return type(os.environ.get(name, default))
+
+
+# Per gunicorn worker process. Extraction is CPU-bound and threads share the
+# GIL, so more than a couple of concurrent requests per process only adds
+# latency; the rest wait in a short queue or are turned away.
+ADMISSION_CLASSES = {
+    # name -> concurrency, queue length, max wait (s), est. seconds per page, per MiB
+    "text": (
+        _env("ADMISSION_TEXT_CONCURRENCY", 2),
+        _env("ADMISSION_TEXT_QUEUE", 8),
+        _env("ADMISSION_TEXT_MAX_WAIT", 30, float),
+        _env("ADMISSION_TEXT_PAGE_SECONDS", 0.15, float),
+        _env("ADMISSION_TEXT_MB_SECONDS", 0.02, float),
+    ),
+    "heavy": (
+        _env("ADMISSION_HEAVY_CONCURRENCY", 1),
+        _env("ADMISSION_HEAVY_QUEUE", 4),
+        _env("ADMISSION_HEAVY_MAX_WAIT", 60, float),
+        _env("ADMISSION_HEAVY_PAGE_SECONDS", 0.4, float),
+        _env("ADMISSION_HEAVY_MB_SECONDS", 0.1, float),
+    ),
+}
+# Used for uploads whose page count cannot be read up front (ZIPs, damaged
+# PDFs, page trees inside compressed object streams).
+ASSUMED_BYTES_PER_PAGE = 100_000
+# Bytes read from each end of an upload looking for the page tree's /Count.
+PAGE_COUNT_SCAN_BYTES = 256 * 1024
+
+# /Count of a /Type /Pages dictionary, in either key order, not crossing
+# the dictionary's end.
+_PAGES_COUNT = re.compile(
+    rb"/Type\s*/Pages\b(?:(?!>>).){0,512}?/Count\s+(\d+)|/Count\s+(\d+)(?:(?!>>).){0,512}?/Type\s*/Pages\b",
+    re.DOTALL,
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def page_count_hint(stream):
+    # The page tree's /Count, read without building any pages; None if the
+    # document cannot be parsed that far.
+    position = stream.tell()
+    try:
+        stream.seek(0)
+        doc = PDFDocument(PDFParser(stream))
+        count = resolve1(resolve1(doc.catalog.get("Pages")).get("Count"))
+        return int(count)
+    except Exception:
+        return None
+    finally:
+        stream.seek(position)
+
+
+def scan_page_count(stream, scan_bytes=PAGE_COUNT_SCAN_BYTES):
+    # The largest /Count of the page tree nodes found in the first and last
+    # scan_bytes of the file, the root's in practice. Reads no more than
+    # that and parses nothing, so a damaged xref cannot make admission
+    # itself slow; None if no page tree node is found there.
+    position = stream.tell()
+    try:
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        data = stream.read(scan_bytes)
+        if size > scan_bytes:
+            stream.seek(max(scan_bytes, size - scan_bytes))
+            data += b"\n" + stream.read(scan_bytes)
+        counts = [int(head or tail) for head, tail in _PAGES_COUNT.findall(data)]
+        return max(counts) if counts else None
+    finally:
+        stream.seek(position)
+
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def estimate_pages(file_storages, ranges=None):
+    # (pages, bytes) the request will process.
+    total_pages = total_bytes = 0
+    for file_storage in file_storages:
+        stream = getattr(file_storage, "stream", file_storage)
+        size = _stream_size(stream)
+        count = scan_page_count(stream)
+        if count is None:
+            count = max(1, size // ASSUMED_BYTES_PER_PAGE)
+        total_pages += len(page_indices(ranges, count))
+        total_bytes += size
+    return total_pages, total_bytes
+
+
+class Ticket:
+    def __init__(self, gate, cost):
+        self.gate = gate
+        self.cost = cost
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.gate._release(self.cost)
+
+
+class AdmissionGate:
+    # At most `concurrency` requests run at once; up to `queue` more wait for
+    # a slot. A request is turned away at once (429) when the queue is full
+    # or the estimated work ahead of it exceeds max_wait, and with 503 when
+    # it waited max_wait without getting a slot.
+    def __init__(self, name, concurrency, queue, max_wait, page_seconds, mb_seconds):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue = queue
+        self.max_wait = max_wait
+        self.page_seconds = page_seconds
+        self.mb_seconds = mb_seconds
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        # Estimated seconds of work admitted or queued and not yet finished.
+        self.backlog = 0.0
+
+    def cost(self, pages, size):
+        return pages * self.page_seconds + size / (1024 * 1024) * self.mb_seconds
+
+    def _retry_after(self):
+        return max(1, math.ceil(self.backlog / self.concurrency))
+
+    def _reject(self, message, status, reason):
+        metrics.inc("pdf_admission_rejected_total", endpoint_class=self.name, reason=reason)
+        raise Overloaded(message, status, self._retry_after())
+
+    def admit(self, cost):
+        started = time.perf_counter()
+        with self._cond:
+            if self.running >= self.concurrency or self.waiting:
+                if self.waiting >= self.queue:
+                    self._reject("Server busy: too many requests queued", 429, "queue_full")
+                if self.backlog / self.concurrency > self.max_wait:
+                    self._reject("Server busy: estimated wait too long", 429, "backlog")
+                self.waiting += 1
+                self.backlog += cost
+                deadline = started + self.max_wait
+                try:
+                    while self.running >= self.concurrency:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            if self.running >= self.concurrency:
+                                self.backlog -= cost
+                                self._reject("Server busy: timed out waiting for capacity", 503, "timeout")
+                finally:
+                    self.waiting -= 1
+            else:
+                self.backlog += cost
+            self.running += 1
+        metrics.observe("pdf_admission_wait_seconds", time.perf_counter() - started, endpoint_class=self.name)
+        return Ticket(self, cost)
+
+    def _release(self, cost):
+        with self._cond:
+            self.running -= 1
+            self.backlog = max(0.0, self.backlog - cost)
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "backlog_seconds": round(self.backlog, 3),
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+            }
+
+
+gates = {name: AdmissionGate(name, *config) for name, config in ADMISSION_CLASSES.items()}
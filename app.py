@@ -1,58 +1,347 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify, make_response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+import functools
+import importlib.metadata
 import os
 import time
-import base64
-import re
-import pdfplumber
-
-try:
-    from pdfplumber.utils import extract_image
-except ImportError:
-    from pdfminer.pdftypes import resolve1
-    from pdfminer.psparser import PSLiteral, PSKeyword
-
-    def _literal_name(val):
-        if isinstance(val, (PSLiteral, PSKeyword)):
-            return val.name
-        if isinstance(val, bytes):
-            return val.decode("latin-1")
-        return str(val)
-
-    def _stream_filters(stream):
-        filters = stream.attrs.get("Filter")
-        if not filters:
-            return []
-        filters = resolve1(filters)
-        if isinstance(filters, list):
-            return [_literal_name(f) for f in filters]
-        return [_literal_name(filters)]
-
-    def extract_image(obj):
-        stream = obj.get("stream")
-        if stream is None:
-            return {"image": None, "ext": None}
-        stream = resolve1(stream)
-        data = stream.get_data()
-        filters = _stream_filters(stream)
-        ext = "bin"
-        for flt in filters:
-            if flt == "DCTDecode":
-                ext = "jpg"
-                break
-            if flt == "JPXDecode":
-                ext = "jp2"
-                break
-            if flt in ("CCITTFaxDecode", "CCFDecode"):
-                ext = "tiff"
-                break
-            if flt in ("FlateDecode", "LZWDecode"):
-                ext = "png"
-                break
-        return {"image": data, "ext": ext}
+import uuid
+
+from admission import Overloaded, estimate_pages, gates, page_count_hint
+from batch import BATCH_HANDLERS, iter_documents, run_batch
+from extractors import (
+    ARTIFACTS,
+    DEFAULT_ARTIFACTS,
+    TABLE_FORMATS,
+    TEXT_ENGINES,
+    extract_all_record,
+    extract_all_result,
+    page_artifacts,
+    page_text,
+    page_words,
+)
+from ingest import MAX_UPLOAD_BYTES, UploadTooLarge, ingest_upload, open_pdf
+from images import DEDUPE_MODES, iter_multipart, iter_pdf_images, iter_zip, json_record, manifest_record
+from json_providers import json_provider
+from jobs import JOB_DIR, JobManager, JobQueueFull, JobStore, track_progress
+from memory import MemoryBudgetExceeded, budgeted, end_budget, start_budget
+from metrics import metrics
+from parallel import MAX_PAGE_WORKERS, count_pages, iter_indexed_pages
+from result_cache import ResultCache, cache_key, file_digest
+from selection import (
+    COORDINATE_DECIMALS,
+    InvalidSelection,
+    parse_fields,
+    parse_page_ranges,
+    parse_precision,
+    selected_pages,
+    stop_after,
+)
+from sessions import DocumentStore, UnknownDocument
+from sitecheck import SITECHECK_FIELDS, SITECHECK_LAYOUTS, SITECHECK_TEMPLATE, parse_sitecheck_protocol
+from time_budget import (
+    TIMED_OUT,
+    current_time_budget,
+    end_time_budget,
+    guarded,
+    start_time_budget,
+    time_budget,
+    time_budget_report,
+)
+from word_locator import WordMatcher, page_header, page_word_locations
+
+IMAGE_FORMATS = ("json", "manifest", "zip", "multipart")
+
 
 app = Flask(__name__)
+app.json = json_provider(app)
 API_KEY = os.environ.get("API_KEY")
 PORT = int(os.environ.get("PORT", 9546))
+# Rejects oversized bodies before multipart parsing; leaves room for form overhead.
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", MAX_UPLOAD_BYTES + 1024 * 1024 if MAX_UPLOAD_BYTES else 0))
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES or None
+# A batch carries many documents, each still held to MAX_UPLOAD_BYTES.
+BATCH_MAX_REQUEST_BYTES = int(os.environ.get("BATCH_MAX_REQUEST_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Parameters that only change how a result is computed, not the result itself.
+CACHE_IGNORED_PARAMS = {"workers"}
+# Bump with any change to what an endpoint returns for the same request.
+RESPONSE_FORMAT_VERSION = 2
+# Part of every result cache key: the disk tier outlives deploys, and these
+# all change the stored bodies.
+CACHE_VERSION = {
+    "format": RESPONSE_FORMAT_VERSION,
+    "pdfplumber": importlib.metadata.version("pdfplumber"),
+    "pdfminer": importlib.metadata.version("pdfminer.six"),
+    "sitecheck_template": SITECHECK_TEMPLATE.digest,
+    "coordinate_decimals": COORDINATE_DECIMALS,
+    "json_encoder": app.json.name,
+}
+
+documents = DocumentStore()
+
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.environ.get("RESULT_CACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", 0)),
+)
+
+
+def cached_response(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        pdf_file = request.files.get("file")
+        if (
+            not result_cache.enabled
+            or not pdf_file
+            or request.headers.get("x-api-key") != API_KEY
+            or wants_ndjson()
+        ):
+            return view(*args, **kwargs)
+        params = {
+            "form": sorted(item for item in request.form.lists() if item[0] not in CACHE_IGNORED_PARAMS),
+            "args": sorted(item for item in request.args.lists() if item[0] not in CACHE_IGNORED_PARAMS),
+        }
+        key = cache_key(file_digest(pdf_file.stream), request.endpoint, params, CACHE_VERSION)
+        body = result_cache.get(key)
+        if body is not None:
+            response = app.response_class(body, mimetype="application/json")
+            response.headers["X-Cache"] = "hit"
+            return response
+        response = make_response(view(*args, **kwargs))
+        if (
+            response.status_code == 200
+            and not response.is_streamed
+            and response.mimetype == "application/json"
+            and "X-Partial-Result" not in response.headers
+        ):
+            result_cache.put(key, response.get_data())
+        response.headers["X-Cache"] = "miss"
+        return response
+
+    return wrapper
+
+
+def admitted(endpoint_class):
+    # Holds a slot of the class's admission gate while the view runs, or
+    # until a streamed body is finished; sized by the pages to be processed.
+    # Unauthenticated requests are turned away before anything is parsed or
+    # a slot is taken, so the views behind it do not check the key again.
+    gate = gates[endpoint_class]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.headers.get("x-api-key") != API_KEY:
+                return jsonify({"error": "Unauthorized"}), 401
+            files = request.files.getlist("file") + request.files.getlist("files")
+            ranges = parse_page_ranges(request.form.get("pages"))
+            if not files and request.form.get("document_id"):
+                with documents.open(request.form.get("document_id")) as upload:
+                    pages, size = estimate_pages([upload.stream], ranges)
+            else:
+                pages, size = estimate_pages(files, ranges)
+            ticket = gate.admit(gate.cost(pages, size))
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(ticket.release)
+            else:
+                ticket.release()
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def wants_ndjson():
+    if request.form.get("stream", "").lower() in ("1", "true", "ndjson"):
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
+
+def extract_pages(upload, page_fn, workers=1, pages=None, stop_at=None, text=lambda result: result):
+    # (page_index, result) pairs for the selected pages; with stop_at, stops
+    # after the first page whose text contains it.
+    results = iter_indexed_pages(upload, page_fn, workers, pages)
+    if stop_at:
+        results = stop_after(results, lambda item: stop_at in text(item[1]))
+    return results
+
+
+def has_document():
+    return bool(request.files.get("file") or request.form.get("document_id"))
+
+
+def request_upload():
+    # The uploaded file, or else the stored file of the document session
+    # named by document_id.
+    pdf_file = request.files.get("file")
+    if pdf_file:
+        return ingest_upload(pdf_file)
+    return documents.open(request.form.get("document_id"))
+
+
+def session_document_id():
+    return None if request.files.get("file") else request.form.get("document_id")
+
+
+def page_functions():
+    # (text, words) page functions; for a document session they are served
+    # from its per-page cache and parse each page at most once.
+    document_id = session_document_id()
+    if not document_id:
+        return page_text, page_words
+    return documents.page_fn(document_id, "text", page_text), documents.page_fn(document_id, "words", page_words)
+
+
+def request_precision():
+    # Decimals to round coordinates to: the precision form field, else the
+    # COORDINATE_DECIMALS default; None keeps full precision.
+    return parse_precision(request.form.get("precision", COORDINATE_DECIMALS))
+
+
+def text_page_function(engine):
+    # page -> (text, engine used). A session caches each engine's text; the
+    # layout text is shared with the word routes.
+    document_id = session_document_id()
+    if not document_id:
+        return TEXT_ENGINES[engine]
+    if engine == "layout":
+        text_fn = documents.page_fn(document_id, "text", page_text)
+        return lambda page: (text_fn(page), "layout")
+    return documents.page_fn(document_id, f"text_{engine}", TEXT_ENGINES[engine])
+
+
+def text_result(results, engine):
+    # results: (page_index, (text, engine used)) pairs.
+    results = list(results)
+    result = {"text": "\n".join(text for _, (text, _) in results), "engine": engine}
+    if engine == "auto":
+        result["layout_pages"] = [index + 1 for index, (_, used) in results if used == "layout"]
+    return result
+
+
+def partial_json(result):
+    # Adds the pages that were skipped or timed out under the request's time
+    # budget; list results only get the header. Partial results are not cached.
+    report = time_budget_report()
+    if not report:
+        return jsonify(result)
+    response = jsonify(dict(result, **report) if isinstance(result, dict) else result)
+    response.headers["X-Partial-Result"] = "true"
+    return response
+
+
+def close_with_response(response, upload):
+    # Streamed bodies are generated after the view returns, so the upload
+    # is released when the response is closed rather than by the view.
+    response.call_on_close(upload.close)
+    return response
+
+
+def ndjson_response(records):
+    # One JSON document per line, produced lazily; a failure mid-stream is
+    # reported as a final {"error": ...} record since the status is already
+    # sent, and pages left out under the time budget as a final report.
+    budget = current_time_budget()
+
+    def generate():
+        with time_budget(budget):
+            try:
+                for record in budgeted(records):
+                    yield app.json.dumps(record) + "\n"
+            except Exception as e:
+                import traceback
+
+                traceback.print_exc()
+                metrics.inc("pdf_request_errors_total", endpoint=request.endpoint)
+                yield app.json.dumps({"error": str(e)}) + "\n"
+            report = time_budget_report()
+            if report:
+                yield app.json.dumps(report) + "\n"
+
+    return app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    start_budget()
+    start_time_budget()
+
+
+@app.before_request
+def batch_request_limit():
+    if request.endpoint == "batch_extract":
+        request.max_content_length = BATCH_MAX_REQUEST_BYTES
+
+
+@app.teardown_request
+def clear_budget(exc):
+    end_budget()
+    end_time_budget()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or "unmatched"
+    started = g.get("request_started", time.perf_counter())
+    status = response.status_code
+
+    def record():
+        # Runs when the response is closed, so streamed bodies are included.
+        metrics.observe("pdf_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+        metrics.inc("pdf_requests_total", endpoint=endpoint, status=status)
+        if status >= 500:
+            metrics.inc("pdf_request_errors_total", endpoint=endpoint)
+        metrics.flush()
+
+    response.call_on_close(record)
+    return response
+
+
+@app.errorhandler(UploadTooLarge)
+def upload_too_large(e):
+    return jsonify({"error": str(e)}), 413
+
+
+@app.errorhandler(MemoryBudgetExceeded)
+def memory_budget_exceeded(e):
+    return jsonify({"error": str(e)}), 413
+
+
+def error_response(e):
+    # Views report unexpected failures as 500; running out of the memory
+    # budget is the document's size, not a server fault.
+    if isinstance(e, MemoryBudgetExceeded):
+        return memory_budget_exceeded(e)
+    return jsonify({"error": str(e)}), 500
+
+
+@app.errorhandler(UnknownDocument)
+def unknown_document(e):
+    return jsonify({"error": str(e)}), 404
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    response = jsonify({"error": str(e)})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
+
+
+@app.errorhandler(InvalidSelection)
+def invalid_selection(e):
+    return jsonify({"error": str(e)}), 400
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"error": "Upload exceeds the maximum request size"}), 413
 
 
 @app.route("/", methods=["GET"])
@@ -65,371 +354,127 @@ def health():
     return "OK", 200
 
 
-@app.route("/extract-sitecheck-protocol", methods=["POST"])
-def extract_sitecheck_protocol():
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
     if request.headers.get("x-api-key") != API_KEY:
         return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(dict(result_cache.snapshot(), layouts=SITECHECK_LAYOUTS.snapshot(), sessions=documents.snapshot()))
 
-    pdf_file = request.files.get("file")
-    if not pdf_file:
-        return jsonify({"error": "No file provided"}), 400
 
-    try:
-        result = {"document_header": {}, "site_info": {}, "sections": []}
-
-        with pdfplumber.open(pdf_file) as pdf:
-            if len(pdf.pages) > 0:
-                first_page = pdf.pages[0]
-                first_page_text = first_page.extract_text() or ""
-                lines = first_page_text.split("\n")
-
-                for line in lines[:10]:
-                    line = line.strip()
-                    doc_id_match = re.match(r"^(\d{6})\s*-\s*(.+)$", line)
-                    if doc_id_match:
-                        result["document_header"]["document_id"] = doc_id_match.group(1)
-                        result["document_header"]["title"] = doc_id_match.group(2)
-                    if "Deutsche Glasfaser" in line:
-                        parts = line.split(" - ")
-                        result["document_header"]["organization"] = parts[0].strip()
-                        if len(parts) > 1:
-                            result["document_header"]["note"] = parts[1].strip()
-
-                field_patterns = [
-                    (r"(\d{4,6})\s*\n\s*Standort\s*\*", "standort"),
-                    (r"Record ID:\s*\*\s*\n\s*(\d+)", "record_id"),
-                    (r"Datum:\s*\*\s*\n\s*(\d{2}\.\d{2}\.\d{4})", "datum"),
-                    (r"POP \(Bundesland\):\s*\*\s*\n\s*([^\n]+)", "pop_bundesland"),
-                    (r"POP ID:\s*\*\s*\n\s*([^\n]+)", "pop_id"),
-                    (r"POP Typ:\s*\*\s*\n\s*([^\n]+)", "pop_typ"),
-                    (r"USV-Typ:\s*\*\s*\n\s*([^\n]+)", "usv_typ"),
-                ]
-
-                for pattern, field_key in field_patterns:
-                    match = re.search(pattern, first_page_text, re.IGNORECASE | re.MULTILINE)
-                    if match:
-                        result["site_info"][field_key] = match.group(1).strip()
-
-                status_options = ["Wartung erfolgreich", "Kein Zugang", "Standort existiert nicht"]
-
-                if hasattr(first_page, "annots") and first_page.annots:
-                    for annot in first_page.annots:
-                        if annot.get("data", {}).get("V"):
-                            for option in status_options:
-                                if option in str(annot.get("data", {})):
-                                    result["site_info"]["status"] = option
-                                    break
-
-                if "status" not in result["site_info"]:
-                    chars_df = first_page.chars
-                    if chars_df is not None and len(chars_df) > 0:
-                        chars = chars_df.to_dict("records") if hasattr(chars_df, "to_dict") else chars_df
-                        for option in status_options:
-                            option_words = first_page.search(option)
-                            if option_words:
-                                option_pos = option_words[0]
-                                for char in chars:
-                                    if (
-                                        char.get("x0", 0) < option_pos["x0"] - 5
-                                        and char.get("x0", 0) > option_pos["x0"] - 30
-                                        and abs(char.get("top", 0) - option_pos["top"]) < 5
-                                    ):
-                                        if char.get("text", "") in ["✓", "X", "■", "●", "x", "✔", "✗"]:
-                                            result["site_info"]["status"] = option
-                                            break
-
-                if "status" not in result["site_info"] and hasattr(first_page, "rects"):
-                    for option in status_options:
-                        option_words = first_page.search(option)
-                        if option_words:
-                            option_pos = option_words[0]
-                            for rect in first_page.rects:
-                                if (
-                                    rect.get("x0", 0) < option_pos["x0"] - 5
-                                    and rect.get("x0", 0) > option_pos["x0"] - 30
-                                    and abs(rect.get("top", 0) - option_pos["top"]) < 10
-                                    and rect.get("fill", False)
-                                ):
-                                    result["site_info"]["status"] = option
-                                    break
-
-            current_section = None
-            current_subsection = None
-
-            for page_num, page in enumerate(pdf.pages):
-                page_text = page.extract_text() or ""
-                tables = page.extract_tables() or []
-                lines = page_text.split("\n")
-
-                for line_idx, line in enumerate(lines):
-                    line = line.strip()
-
-                    section_match = re.match(r"^(\d+)\.\s+(.+)$", line)
-                    if section_match:
-                        current_section = {
-                            "number": section_match.group(1),
-                            "title": section_match.group(2),
-                            "subsections": [],
-                            "page": page_num + 1,
-                        }
-                        result["sections"].append(current_section)
-                        current_subsection = None
-                        continue
+@app.route("/admission-stats", methods=["GET"])
+def admission_stats():
+    if request.headers.get("x-api-key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({name: gate.snapshot() for name, gate in gates.items()})
 
-                    subsection_match = re.match(r"^(\d+\.\d+)\s+(.+)$", line)
-                    if subsection_match and current_section:
-                        current_subsection = {
-                            "number": subsection_match.group(1),
-                            "title": subsection_match.group(2),
-                            "items": [],
-                            "page": page_num + 1,
-                        }
-                        current_section["subsections"].append(current_subsection)
-                        continue
 
-                    if re.match(r"^\d+\.jpg$", line, re.IGNORECASE):
-                        if current_subsection:
-                            current_subsection.setdefault("images", []).append(line)
-
-                    if line.endswith("*") and current_subsection:
-                        field_name = line.replace("*", "").strip()
-                        if line_idx + 1 < len(lines):
-                            value = lines[line_idx + 1].strip()
-                            if value and not value.endswith("*"):
-                                field_key = field_name.lower().replace(" ", "_").replace("-", "_")
-                                current_subsection[field_key] = value
-
-                    if "PoP Status" in line and current_subsection:
-                        for i in range(line_idx + 1, min(line_idx + 3, len(lines))):
-                            if i < len(lines) and ("Status 7" in lines[i] or "Status 9" in lines[i]):
-                                status_line = lines[i]
-                                if "✓" in status_line or "X" in status_line or "■" in status_line:
-                                    if "Status 7" in status_line and any(
-                                        marker in status_line.split("Status 7")[0] for marker in ["✓", "X", "■"]
-                                    ):
-                                        current_subsection["pop_status"] = "Status 7"
-                                    elif "Status 9" in status_line and any(
-                                        marker in status_line.split("Status 9")[0] for marker in ["✓", "X", "■"]
-                                    ):
-                                        current_subsection["pop_status"] = "Status 9"
-                                else:
-                                    status_7_pos = page.search("Status 7")
-                                    status_9_pos = page.search("Status 9")
-                                    if hasattr(page, "rects"):
-                                        for rect in page.rects:
-                                            if rect.get("fill", False):
-                                                if status_7_pos and (
-                                                    rect["x0"] < status_7_pos[0]["x0"] - 5
-                                                    and rect["x0"] > status_7_pos[0]["x0"] - 30
-                                                    and abs(rect["top"] - status_7_pos[0]["top"]) < 10
-                                                ):
-                                                    current_subsection["pop_status"] = "Status 7"
-                                                elif status_9_pos and (
-                                                    rect["x0"] < status_9_pos[0]["x0"] - 5
-                                                    and rect["x0"] > status_9_pos[0]["x0"] - 30
-                                                    and abs(rect["top"] - status_9_pos[0]["top"]) < 10
-                                                ):
-                                                    current_subsection["pop_status"] = "Status 9"
-                                break
-
-                    if "ZAS Schlüssel" in line and current_subsection:
-                        zas_key = "zas_schluessel" if "2.4.2" in line else "zas_schluessel_vor_ort"
-                        for i in range(line_idx + 1, min(line_idx + 4, len(lines))):
-                            if i < len(lines):
-                                option_line = lines[i]
-                                if "Schlüssel" in option_line:
-                                    if any(marker in option_line for marker in ["✓", "X", "■", "●"]):
-                                        value = (
-                                            option_line.replace("✓", "")
-                                            .replace("X", "")
-                                            .replace("■", "")
-                                            .replace("●", "")
-                                            .strip()
-                                        )
-                                        current_subsection[zas_key] = value
-                                        break
-
-                if current_subsection and tables:
-                    for table in tables:
-                        if not table or len(table) < 2:
-                            continue
-                        headers = table[0] if table else []
-                        if any("OK" in str(h) and "Nicht OK" in str(h) for h in headers):
-                            ok_col = nicht_ok_col = nicht_notwendig_col = None
-                            for i, header in enumerate(headers):
-                                header_str = str(header) if header else ""
-                                if header_str == "OK":
-                                    ok_col = i
-                                elif "Nicht OK" in header_str:
-                                    nicht_ok_col = i
-                                elif "Nicht notwendig" in header_str or "notwendig" in header_str:
-                                    nicht_notwendig_col = i
-
-                            for row in table[1:]:
-                                if len(row) < 2:
-                                    continue
-                                item_text = str(row[0]) if row[0] else ""
-                                desc_text = str(row[1]) if len(row) > 1 and row[1] else ""
-                                full_text = f"{item_text} {desc_text}".strip()
-                                item_match = re.match(r"^(\d+\.\d+\.\d+)\s+(.+)$", full_text)
-                                if item_match and item_match.group(1).startswith(current_subsection["number"] + "."):
-                                    status = "Not checked"
-                                    if ok_col is not None and len(row) > ok_col:
-                                        cell_content = str(row[ok_col]).strip()
-                                        if cell_content and cell_content not in ["", "OK", "-", " "]:
-                                            status = "OK"
-                                    if nicht_ok_col is not None and len(row) > nicht_ok_col:
-                                        cell_content = str(row[nicht_ok_col]).strip()
-                                        if cell_content and cell_content not in ["", "Nicht OK", "-", " "]:
-                                            status = "Nicht OK"
-                                    if nicht_notwendig_col is not None and len(row) > nicht_notwendig_col:
-                                        cell_content = str(row[nicht_notwendig_col]).strip()
-                                        if cell_content and cell_content not in ["", "Nicht notwendig", "notwendig", "-", " "]:
-                                            status = "Nicht notwendig"
-                                    full_row_text = " ".join(str(cell) for cell in row)
-                                    if status == "Not checked":
-                                        if any(marker in full_row_text for marker in ["✓", "X", "■", "●", "✔"]):
-                                            for i, cell in enumerate(row):
-                                                cell_str = str(cell)
-                                                if any(marker in cell_str for marker in ["✓", "X", "■", "●", "✔"]):
-                                                    if i == ok_col:
-                                                        status = "OK"
-                                                    elif i == nicht_ok_col:
-                                                        status = "Nicht OK"
-                                                    elif i == nicht_notwendig_col:
-                                                        status = "Nicht notwendig"
-                                                    break
-                                    current_subsection["items"].append(
-                                        {
-                                            "number": item_match.group(1),
-                                            "description": item_match.group(2).strip(),
-                                            "status": status,
-                                            "page": page_num + 1,
-                                        }
-                                    )
+@app.route("/extract-sitecheck-protocol", methods=["POST"])
+@cached_response
+@admitted("heavy")
+def extract_sitecheck_protocol():
+    if not has_document():
+        return jsonify({"error": "No file provided"}), 400
+    fields = parse_fields(request.form.get("fields"), SITECHECK_FIELDS, SITECHECK_FIELDS)
+    pages = parse_page_ranges(request.form.get("pages"))
 
-        return jsonify(result)
+    upload = request_upload()
+    try:
+        with upload, open_pdf(upload.stream) as pdf:
+            result = parse_sitecheck_protocol(pdf, fields=fields, pages=pages)
+        return partial_json(result)
     except Exception as e:
         import traceback
 
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 
-def locate_words(pdf_path, targets):
+def locate_words(pdf_source, targets, pages=None, words_fn=page_words, decimals=None):
+    # (locations, page headers), with a header for each page that has a hit.
+    matcher = WordMatcher(targets)
     found = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            words = page.extract_words(keep_blank_chars=True)
-            word_texts = [w["text"].strip() for w in words]
-            word_texts_lower = [w.lower() for w in word_texts]
-            for target in targets:
-                target_clean = target.strip().lower()
-                target_words = [tw.strip() for tw in target_clean.split()]
-                if len(target_words) == 1:
-                    for i, w in enumerate(word_texts_lower):
-                        if target_words[0] in w:
-                            word = words[i]
-                            found.append(
-                                {
-                                    "page": page_num,
-                                    "text": word["text"],
-                                    "x0": float(word["x0"]),
-                                    "y0": float(word["top"]),
-                                    "x1": float(word["x1"]),
-                                    "y1": float(word["bottom"]),
-                                    "page_width": page.width,
-                                    "page_height": page.height,
-                                }
-                            )
-                else:
-                    joined_target = " ".join(target_words)
-                    for i, w in enumerate(word_texts_lower):
-                        if w == joined_target:
-                            word = words[i]
-                            found.append(
-                                {
-                                    "page": page_num,
-                                    "text": word["text"],
-                                    "x0": float(word["x0"]),
-                                    "y0": float(word["top"]),
-                                    "x1": float(word["x1"]),
-                                    "y1": float(word["bottom"]),
-                                    "page_width": page.width,
-                                    "page_height": page.height,
-                                }
-                            )
-                    for i in range(len(word_texts_lower) - len(target_words) + 1):
-                        if word_texts_lower[i : i + len(target_words)] == target_words:
-                            first = words[i]
-                            last = words[i + len(target_words) - 1]
-                            found.append(
-                                {
-                                    "page": page_num,
-                                    "text": " ".join(word_texts[i : i + len(target_words)]),
-                                    "x0": float(first["x0"]),
-                                    "y0": float(first["top"]),
-                                    "x1": float(last["x1"]),
-                                    "y1": float(last["bottom"]),
-                                    "page_width": page.width,
-                                    "page_height": page.height,
-                                }
-                            )
-    return found
+    headers = []
+    with open_pdf(pdf_source) as pdf:
+        for page_num, page in selected_pages(pdf, pages):
+            words = guarded(page_num, words_fn, page)
+            if words is TIMED_OUT:
+                continue
+            locations = page_word_locations(page_num, words, matcher, decimals)
+            if locations:
+                headers.append(page_header(page_num, page, decimals))
+                found.extend(locations)
+    return found, headers
 
 
 @app.route("/locate-words", methods=["POST"])
+@cached_response
+@admitted("text")
 def locate_words_endpoint():
-    if request.headers.get("x-api-key") != API_KEY:
-        return jsonify({"error": "Unauthorized"}), 401
-    pdf_file = request.files.get("file")
     words_to_redact = request.form.getlist("words")
-    if not pdf_file:
+    if not has_document():
         return jsonify({"error": "No file provided"}), 400
     if not words_to_redact:
         return jsonify({"error": "No words provided"}), 400
-    temp_path = os.path.join("/tmp", f"pdfplumber_temp_{int(time.time())}.pdf")
-    pdf_file.save(temp_path)
+    pages = parse_page_ranges(request.form.get("pages"))
+    decimals = request_precision()
+    upload = request_upload()
     try:
-        results = locate_words(temp_path, words_to_redact)
-        os.remove(temp_path)
-        return jsonify({"locations": results})
+        with upload:
+            results, headers = locate_words(upload.stream, words_to_redact, pages, page_functions()[1], decimals)
+        return partial_json({"pages": headers, "locations": results})
     except Exception as e:
-        os.remove(temp_path)
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 
 @app.route("/debug-words", methods=["POST"])
+@admitted("text")
 def debug_words():
-    pdf_file = request.files.get("file")
-    if not pdf_file:
+    if not has_document():
         return jsonify({"error": "No file provided"}), 400
-    temp_path = os.path.join("/tmp", f"debug_temp_{int(time.time())}.pdf")
-    pdf_file.save(temp_path)
+    pages = parse_page_ranges(request.form.get("pages"))
     output = []
-    with pdfplumber.open(temp_path) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            words = page.extract_words(keep_blank_chars=True)
+    _, words_fn = page_functions()
+    with request_upload() as upload, open_pdf(upload.stream) as pdf:
+        for page_num, page in selected_pages(pdf, pages):
+            words = guarded(page_num, words_fn, page)
+            if words is TIMED_OUT:
+                continue
             output.append({"page": page_num, "words": [w["text"] for w in words]})
-    os.remove(temp_path)
-    return jsonify(output)
+    return partial_json(output)
 
 
 @app.route("/redact", methods=["POST"])
+@cached_response
+@admitted("text")
 def redact_text():
-    if request.headers.get("x-api-key") != API_KEY:
-        return jsonify({"error": "Unauthorized"}), 401
-    pdf_file = request.files.get("file")
     field_name = request.form.get("fieldName")
-    if not pdf_file:
+    if not has_document():
         return jsonify({"error": "No file provided"}), 400
     if not field_name:
         return jsonify({"error": "No field name provided"}), 400
+    words_to_locate = request.form.getlist("words")
+    pages = parse_page_ranges(request.form.get("pages"))
+    decimals = request_precision()
+    text_fn, words_fn = page_functions()
+    upload = request_upload()
     try:
-        with pdfplumber.open(pdf_file) as pdf:
+        with upload, open_pdf(upload.stream) as pdf:
+            # Every "page" in the response is 1-based, in redaction_targets as
+            # in pages and locations (/locate-words keeps its 0-based pages).
             results = []
-            for page_num, page in enumerate(pdf.pages, 1):
-                text = page.extract_text() or ""
+            matcher = WordMatcher(words_to_locate) if words_to_locate else None
+            locations = []
+            headers = []
+            for index, page in selected_pages(pdf, pages):
+                page_num = index + 1
+                text = guarded(index, text_fn, page)
+                if text is TIMED_OUT:
+                    continue
                 lines = text.split("\n")
                 for line in lines:
                     if field_name in line:
@@ -437,132 +482,318 @@ def redact_text():
                         if len(parts) > 1:
                             value_to_redact = parts[1].strip()
                             results.append({"page": page_num, "field": field_name, "value_detected": value_to_redact})
-            return jsonify({"redaction_targets": results})
+                if matcher:
+                    words = guarded(index, words_fn, page)
+                    if words is TIMED_OUT:
+                        continue
+                    page_locations = page_word_locations(page_num, words, matcher, decimals)
+                    if page_locations:
+                        headers.append(page_header(page_num, page, decimals))
+                        locations.extend(page_locations)
+            if matcher:
+                return partial_json({"redaction_targets": results, "pages": headers, "locations": locations})
+            return partial_json({"redaction_targets": results})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 
 @app.route("/extract", methods=["POST"])
+@cached_response
+@admitted("text")
 def extract_text():
-    if request.headers.get("x-api-key") != API_KEY:
-        return jsonify({"error": "Unauthorized"}), 401
-    pdf_file = request.files.get("file")
-    if not pdf_file:
+    if not has_document():
         return jsonify({"error": "No file provided"}), 400
+    engine = request.form.get("engine", "layout")
+    if engine not in TEXT_ENGINES:
+        return jsonify({"error": f"engine must be one of {', '.join(TEXT_ENGINES)}"}), 400
+    pages = parse_page_ranges(request.form.get("pages"))
+    stop_at = request.form.get("stop_at")
+    page_fn = text_page_function(engine)
+    upload = request_upload()
     try:
-        with pdfplumber.open(pdf_file) as pdf:
-            text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-        return jsonify({"text": text})
+        # Session page caches live in this process, so those pages are not
+        # handed to worker processes.
+        workers = 1 if page_fn is not TEXT_ENGINES[engine] else request.form.get("workers", default=1, type=int)
+        with upload:
+            results = extract_pages(upload, page_fn, workers, pages, stop_at, text=lambda result: result[0])
+            result = text_result(results, engine)
+        return partial_json(result)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 
 @app.route("/extract-all", methods=["POST"])
+@cached_response
+@admitted("heavy")
 def extract_all():
-    if request.headers.get("x-api-key") != API_KEY:
-        return jsonify({"error": "Unauthorized"}), 401
-    pdf_file = request.files.get("file")
-    if not pdf_file:
+    if not has_document():
         return jsonify({"error": "No file provided"}), 400
+    table_format = request.form.get("table_format", "records")
+    if table_format not in TABLE_FORMATS:
+        return jsonify({"error": f"table_format must be one of {', '.join(TABLE_FORMATS)}"}), 400
+    include = parse_fields(request.form.get("include"), ARTIFACTS, DEFAULT_ARTIFACTS)
+    pages = parse_page_ranges(request.form.get("pages"))
+    decimals = request_precision()
+    stop_at = request.form.get("stop_at")
+    # stop_at needs each page's text even when the response leaves it out.
+    page_fn = functools.partial(page_artifacts, include=include | {"text"} if stop_at else include)
+    upload = request_upload()
     try:
-        import pandas as pd
-
-        result = {"text": [], "tables": [], "combined": []}
-        with pdfplumber.open(pdf_file) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
-                text = page.extract_text() or ""
-                result["text"].append({"page": page_num, "content": text})
-                tables = page.extract_tables() or []
-                page_tables = []
-                for i, table in enumerate(tables, 1):
-                    if not table:
-                        continue
-                    safe_table = [[cell or "" for cell in row] for row in table]
-                    headers = safe_table[0] if safe_table else []
-                    data = safe_table[1:] if len(safe_table) > 1 else []
-                    df = pd.DataFrame(data, columns=headers)
-                    table_data = {"table_number": i, "headers": headers, "data": df.to_dict(orient="records")}
-                    page_tables.append(table_data)
-                if page_tables:
-                    result["tables"].append({"page": page_num, "tables": page_tables})
-                elements = []
-                if text:
-                    elements.append({"type": "text", "content": text})
-                for i, table in enumerate(tables, 1):
-                    if not table:
-                        continue
-                    safe_table = [[cell or "" for cell in row] for row in table]
-                    headers = safe_table[0] if safe_table else []
-                    data = safe_table[1:] if len(safe_table) > 1 else []
-                    df = pd.DataFrame(data, columns=headers)
-                    elements.append(
-                        {"type": "table", "table_number": i, "headers": headers, "data": df.to_dict(orient="records")}
-                    )
-                result["combined"].append({"page": page_num, "elements": elements})
-        return jsonify(result)
+        workers = request.form.get("workers", default=1, type=int)
+        results = extract_pages(upload, page_fn, workers, pages, stop_at, text=lambda artifacts: artifacts["text"])
+        if wants_ndjson():
+
+            def records():
+                for index, artifacts in results:
+                    yield extract_all_record(index + 1, artifacts, table_format, include, decimals)
+
+            return close_with_response(ndjson_response(records()), upload)
+
+        with upload:
+            result = extract_all_result(results, table_format, include, decimals)
+        return partial_json(result)
     except Exception as e:
+        upload.close()
         import traceback
 
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 
 @app.route("/extract-images", methods=["POST"])
+@cached_response
+@admitted("heavy")
 def extract_images():
+    if not has_document():
+        return jsonify({"error": "No file provided"}), 400
+
+    dedupe = request.form.get("dedupe", "name")
+    if dedupe not in DEDUPE_MODES:
+        return jsonify({"error": f"dedupe must be one of {', '.join(DEDUPE_MODES)}"}), 400
+    output = request.form.get("format", "json")
+    if output not in IMAGE_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(IMAGE_FORMATS)}"}), 400
+    decode = output != "manifest"
+    # Plain JSON records carry no hash, so it is only computed to dedupe.
+    hashes = output != "json"
+    pages = parse_page_ranges(request.form.get("pages"))
+
+    upload = request_upload()
+    try:
+        if output in ("zip", "multipart"):
+            budget = current_time_budget()
+            report = budget.report if budget is not None else None
+
+            def images():
+                with time_budget(budget), open_pdf(upload.stream) as pdf:
+                    yield from budgeted(iter_pdf_images(pdf, dedupe=dedupe, pages=pages))
+
+            if output == "zip":
+                response = app.response_class(iter_zip(images(), report), mimetype="application/zip")
+                response.headers["Content-Disposition"] = 'attachment; filename="images.zip"'
+                return close_with_response(response, upload)
+            boundary = uuid.uuid4().hex
+            response = app.response_class(
+                iter_multipart(images(), boundary, report), mimetype=f"multipart/mixed; boundary={boundary}"
+            )
+            return close_with_response(response, upload)
+
+        to_record = json_record if decode else manifest_record
+        if wants_ndjson():
+
+            def records():
+                with open_pdf(upload.stream) as pdf:
+                    for image in iter_pdf_images(pdf, dedupe=dedupe, decode=decode, pages=pages, hashes=hashes):
+                        yield to_record(image)
+
+            return close_with_response(ndjson_response(records()), upload)
+
+        with upload, open_pdf(upload.stream) as pdf:
+            images = iter_pdf_images(pdf, dedupe=dedupe, decode=decode, pages=pages, hashes=hashes)
+            images_out = [to_record(image) for image in images]
+        return partial_json({"images": images_out})
+    except Exception as e:
+        upload.close()
+        return error_response(e)
+
+
+@app.route("/batch/<kind>", methods=["POST"])
+@admitted("heavy")
+def batch_extract(kind):
+    if kind not in BATCH_HANDLERS:
+        return jsonify({"error": f"Batch kind must be one of {', '.join(BATCH_HANDLERS)}"}), 404
+    pdf_files = request.files.getlist("file") + request.files.getlist("files")
+    if not pdf_files:
+        return jsonify({"error": "No file provided"}), 400
+    concurrency = max(1, min(request.form.get("concurrency", default=MAX_PAGE_WORKERS, type=int), MAX_PAGE_WORKERS))
+
+    uploads = []
+    try:
+        for pdf_file in pdf_files:
+            uploads.append((pdf_file.filename, ingest_upload(pdf_file, max_bytes=BATCH_MAX_REQUEST_BYTES)))
+    except UploadTooLarge:
+        for _, upload in uploads:
+            upload.close()
+        raise
+
+    def close_uploads():
+        for _, upload in uploads:
+            upload.close()
+
+    records = run_batch(kind, iter_documents(uploads), concurrency)
+    response = ndjson_response(records)
+    response.call_on_close(close_uploads)
+    return response
+
+
+@app.route("/documents", methods=["POST"])
+def create_document():
+    # Upload once, then pass the returned document_id instead of a file to
+    # any endpoint; text and words parsed from its pages are reused.
     if request.headers.get("x-api-key") != API_KEY:
         return jsonify({"error": "Unauthorized"}), 401
-
     pdf_file = request.files.get("file")
     if not pdf_file:
         return jsonify({"error": "No file provided"}), 400
+    with ingest_upload(pdf_file) as upload:
+        pages = page_count_hint(upload.stream)
+        document_id = documents.create(upload)
+    response = jsonify(dict(documents.info(document_id), pages=pages))
+    response.headers["Location"] = f"/documents/{document_id}"
+    return response, 201
 
-    try:
-        images_out = []
-        with pdfplumber.open(pdf_file) as pdf:
-            seen = set()
-            for page_num, page in enumerate(pdf.pages, 1):
-                raw_image_objs = getattr(page, "objects", None)
-
-                if raw_image_objs and hasattr(raw_image_objs, "get"):
-                    image_objects = raw_image_objs.get("image", {}) or {}
-                else:
-                    candidates = raw_image_objs if isinstance(raw_image_objs, list) else []
-                    image_objects = {
-                        obj.get("name"): obj
-                        for obj in candidates
-                        if isinstance(obj, dict)
-                        and obj.get("object_type") == "image"
-                        and obj.get("name")
-                    }
-
-                for img in page.images:
-                    name = img.get("name")
-                    if not name or name in seen:
-                        continue
-                    seen.add(name)
 
-                    obj = image_objects.get(name)
-                    if not obj:
-                        continue
+@app.route("/documents/<document_id>", methods=["GET"])
+def get_document(document_id):
+    if request.headers.get("x-api-key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    with documents.open(document_id) as upload:
+        pages = page_count_hint(upload.stream)
+    return jsonify(dict(documents.info(document_id), pages=pages))
 
-                    extracted = extract_image(obj)
-                    img_bytes = extracted.get("image")
-                    if not img_bytes:
-                        continue
 
-                    img_ext = extracted.get("ext") or "bin"
-                    images_out.append(
-                        {
-                            "page": page_num,
-                            "name": name,
-                            "ext": img_ext,
-                            "data_base64": base64.b64encode(img_bytes).decode("utf-8"),
-                        }
-                    )
-        return jsonify({"images": images_out})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route("/documents/<document_id>", methods=["DELETE"])
+def delete_document(document_id):
+    if request.headers.get("x-api-key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    documents.delete(document_id)
+    return "", 204
+
+
+def job_param(params, name, default=None, type=str):
+    values = params.get(name) or []
+    try:
+        return type(values[0]) if values else default
+    except (TypeError, ValueError):
+        return default
+
+
+def run_extract_job(upload, params, progress):
+    workers = job_param(params, "workers", 1, int)
+    pages = parse_page_ranges(job_param(params, "pages"))
+    engine = job_param(params, "engine", "layout")
+    if engine not in TEXT_ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(TEXT_ENGINES)}")
+    results = extract_pages(
+        upload, TEXT_ENGINES[engine], workers, pages, job_param(params, "stop_at"), text=lambda result: result[0]
+    )
+    return text_result(track_progress(results, count_pages(upload, pages), progress), engine)
+
+
+def run_extract_all_job(upload, params, progress):
+    workers = job_param(params, "workers", 1, int)
+    table_format = job_param(params, "table_format", "records")
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"table_format must be one of {', '.join(TABLE_FORMATS)}")
+    include = parse_fields(job_param(params, "include"), ARTIFACTS, DEFAULT_ARTIFACTS)
+    pages = parse_page_ranges(job_param(params, "pages"))
+    decimals = parse_precision(job_param(params, "precision", COORDINATE_DECIMALS))
+    stop_at = job_param(params, "stop_at")
+    page_fn = functools.partial(page_artifacts, include=include | {"text"} if stop_at else include)
+    results = extract_pages(upload, page_fn, workers, pages, stop_at, text=lambda artifacts: artifacts["text"])
+    results = track_progress(results, count_pages(upload, pages), progress)
+    return extract_all_result(results, table_format, include, decimals)
+
+
+def run_sitecheck_job(upload, params, progress):
+    fields = parse_fields(job_param(params, "fields"), SITECHECK_FIELDS, SITECHECK_FIELDS)
+    pages = parse_page_ranges(job_param(params, "pages"))
+    with open_pdf(upload.stream) as pdf:
+        return parse_sitecheck_protocol(
+            pdf, on_page=lambda page_num, total: progress(page_num - 1, total), fields=fields, pages=pages
+        )
+
+
+job_manager = JobManager(JobStore(os.path.join(JOB_DIR, "jobs.sqlite3")), dumps=app.json.dumps)
+job_manager.register("extract", run_extract_job)
+job_manager.register("extract-all", run_extract_all_job)
+job_manager.register("extract-sitecheck-protocol", run_sitecheck_job)
+
+
+def job_status(job):
+    status = {key: job[key] for key in ("type", "status", "pages_done", "pages_total", "error", "created", "updated")}
+    status["job_id"] = job["id"]
+    status["finished"] = job["finished"]
+    return status
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    if request.headers.get("x-api-key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not has_document():
+        return jsonify({"error": "No file provided"}), 400
+    job_type = request.form.get("type")
+    if job_type not in job_manager.handlers:
+        return jsonify({"error": f"type must be one of {', '.join(job_manager.handlers)}"}), 400
+    params = {key: values for key, values in request.form.lists() if key != "type"}
+    with request_upload() as upload:
+        try:
+            job_id = job_manager.submit(job_type, upload, params)
+        except JobQueueFull as e:
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = "30"
+            return response, 503
+    response = jsonify(
+        {
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result",
+        }
+    )
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response, 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    if request.headers.get("x-api-key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job))
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    if request.headers.get("x-api-key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    job = job_manager.result(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "failed":
+        return jsonify(dict(job_status(job), error=job["error"])), 500
+    if job["status"] != "done":
+        response = jsonify(job_status(job))
+        response.headers["Retry-After"] = "2"
+        return response, 202
+    return app.response_class(job["result"], mimetype="application/json")
 
 
 if __name__ == "__main__":
+    # The development server runs jobs in-process; deployments run the
+    # separate `python -m jobs` worker instead.
+    job_manager.start()
     app.run(host="0.0.0.0", port=PORT)
@@ -0,0 +1,136 @@
+import io
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from extractors import page_text
+from ingest import MAX_UPLOAD_BYTES, Upload, UploadTooLarge, open_pdf
+from metrics import metrics
+from parallel import submit_task
+from selection import selected_pages
+from sitecheck import parse_sitecheck_protocol
+from time_budget import TIMED_OUT, TimeBudget, guarded, time_budget
+
+
+def _extract(pdf):
+    texts = (guarded(index, page_text, page) for index, page in selected_pages(pdf, None))
+    return {"text": "\n".join(text for text in texts if text is not TIMED_OUT)}
+
+
+BATCH_HANDLERS = {
+    "extract": _extract,
+    "extract-sitecheck-protocol": parse_sitecheck_protocol,
+}
+
+
+def run_document(kind, source):
+    # Each document gets a time budget of its own, like a single request.
+    started = time.perf_counter()
+    with time_budget(TimeBudget()) as budget, open_pdf(source) as pdf:
+        result = BATCH_HANDLERS[kind](pdf)
+        pages = len(pdf.pages)
+    result = dict(result, **budget.report())
+    metrics.flush()
+    return result, pages, time.perf_counter() - started
+
+
+def iter_documents(uploads, max_bytes=None):
+    # Expands (filename, Upload) pairs into one entry per PDF: ZIP uploads
+    # yield their members. A member that cannot be used is yielded with an
+    # exception in place of its Upload so it still gets a result record.
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    for filename, upload in uploads:
+        if not zipfile.is_zipfile(upload.stream):
+            upload.stream.seek(0)
+            if max_bytes and upload.size > max_bytes:
+                upload.close()
+                yield filename, UploadTooLarge(upload.size, max_bytes)
+                continue
+            yield filename, upload
+            continue
+        upload.stream.seek(0)
+        with zipfile.ZipFile(upload.stream) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if max_bytes and info.file_size > max_bytes:
+                    yield info.filename, UploadTooLarge(info.file_size, max_bytes)
+                    continue
+                data = archive.read(info)
+                yield info.filename, Upload(io.BytesIO(data), len(data))
+        upload.close()
+
+
+def _record(index, filename, outcome, wait_seconds):
+    record = {"index": index, "filename": filename, "wait_seconds": round(wait_seconds, 4)}
+    if isinstance(outcome, BaseException):
+        record.update(status="error", error=str(outcome))
+    else:
+        result, pages, seconds = outcome
+        record.update(status="ok", pages=pages, seconds=round(seconds, 4), result=result)
+    return record
+
+
+def run_batch(kind, documents, concurrency=1):
+    # Yields one record per document as it completes. At most `concurrency`
+    # documents are in flight on the shared process pool, so a large ZIP is
+    # unpacked only as fast as it is processed.
+    if concurrency <= 1:
+        for index, (filename, upload) in enumerate(documents):
+            queued = time.perf_counter()
+            if isinstance(upload, BaseException):
+                yield _record(index, filename, upload, 0.0)
+                continue
+            try:
+                outcome = run_document(kind, upload.stream)
+            except Exception as e:
+                outcome = e
+            finally:
+                upload.close()
+            yield _record(index, filename, outcome, time.perf_counter() - queued - _seconds(outcome))
+        return
+
+    pending = enumerate(documents)
+    in_flight = {}
+
+    def fill():
+        while len(in_flight) < concurrency:
+            item = next(pending, None)
+            if item is None:
+                return None
+            index, (filename, upload) = item
+            if isinstance(upload, BaseException):
+                return index, filename, upload
+            future = submit_task(run_document, kind, upload.ensure_path())
+            in_flight[future] = (index, filename, upload, time.perf_counter())
+        return None
+
+    try:
+        while True:
+            failed = fill()
+            if failed:
+                yield _record(*failed, 0.0)
+                continue
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, filename, upload, submitted = in_flight.pop(future)
+                # A crashed pool process fails every document in flight with
+                # BrokenProcessPool; they get error records and the next
+                # submit starts a new pool.
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = e
+                finally:
+                    upload.close()
+                yield _record(index, filename, outcome, time.perf_counter() - submitted - _seconds(outcome))
+    finally:
+        for future, (_, _, upload, _) in in_flight.items():
+            future.cancel()
+            upload.close()
+
+
+def _seconds(outcome):
+    return 0.0 if isinstance(outcome, BaseException) else outcome[2]
@@ -0,0 +1,218 @@
+import hashlib
+import random
+import zlib
+
+# Deterministic synthetic PDFs for the benchmarks: the same parameters always
+# produce the same bytes, with no fonts or files needed beyond Helvetica.
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+
+
+def _escape(s):
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages, images=None):
+    # pages: one list of content-stream operators per page.
+    # images: name -> (width, height, raw RGB bytes), available on every page.
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    image_ids = {}
+    for name, (width, height, raw) in (images or {}).items():
+        data = zlib.compress(raw)
+        image_ids[name] = add(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB"
+            b" /BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n" % (width, height, len(data))
+            + data
+            + b"\nendstream"
+        )
+    pages_id = add(b"")
+    kids = []
+    xobjects = " ".join(f"/{name} {obj} 0 R" for name, obj in image_ids.items())
+    for ops in pages:
+        content = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        kids.append(
+            add(
+                (
+                    f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}]"
+                    f" /Resources << /Font << /F1 {font} 0 R >> /XObject << {xobjects} >> >>"
+                    f" /Contents {content_id} 0 R >>"
+                ).encode()
+            )
+        )
+    objects[pages_id - 1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+    ).encode()
+    catalog = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def text(x, y, s, size=10):
+    # x, y measured from the top-left corner, like pdfplumber's coordinates.
+    return f"BT /F1 {size} Tf {x:g} {PAGE_HEIGHT - y:g} Td ({_escape(s)}) Tj ET"
+
+
+def rect(x, y, width, height, fill=False):
+    return f"{x:g} {PAGE_HEIGHT - y - height:g} {width:g} {height:g} re {'f' if fill else 'S'}"
+
+
+def table(x, y, rows, col_widths, row_height=16):
+    ops = []
+    total_width = sum(col_widths)
+    total_height = row_height * len(rows)
+    for r in range(len(rows) + 1):
+        line_y = PAGE_HEIGHT - y - r * row_height
+        ops.append(f"{x:g} {line_y:g} m {x + total_width:g} {line_y:g} l S")
+    col_x = x
+    for c in range(len(col_widths) + 1):
+        ops.append(f"{col_x:g} {PAGE_HEIGHT - y:g} m {col_x:g} {PAGE_HEIGHT - y - total_height:g} l S")
+        if c < len(col_widths):
+            col_x += col_widths[c]
+    for r, row in enumerate(rows):
+        col_x = x
+        for c, cell in enumerate(row):
+            if cell:
+                ops.append(text(col_x + 2, y + r * row_height + 12, cell, 8))
+            col_x += col_widths[c]
+    return ops
+
+
+ITEM_HEADERS = ["Punkt", "Beschreibung", "OK", "Nicht OK", "Nicht notwendig"]
+ITEM_WIDTHS = [50, 150, 60, 60, 90]
+
+
+def sitecheck_pdf(pages=6, seed=0):
+    rng = random.Random(seed)
+    first = [
+        text(40, 40, "123456 - Wartungsprotokoll POP"),
+        text(40, 56, "Deutsche Glasfaser - Intern"),
+        text(40, 80, str(rng.randint(10000, 99999))),
+        text(40, 94, "Standort *"),
+        text(40, 112, "Record ID: *"),
+        text(40, 126, str(rng.randint(10000, 99999))),
+        text(40, 144, "Datum: *"),
+        text(40, 158, f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2024"),
+        text(40, 176, "POP ID: *"),
+        text(40, 190, f"POP-{rng.randint(1, 99)}"),
+        text(60, 220, "Wartung erfolgreich"),
+        rect(42, 212, 8, 8, fill=True),
+        text(60, 240, "Kein Zugang"),
+        rect(42, 232, 8, 8),
+        text(60, 260, "Standort existiert nicht"),
+        rect(42, 252, 8, 8),
+        text(40, 290, "1. Allgemein"),
+        text(40, 310, "1.1 Zugang"),
+        text(40, 330, "Schlosstyp *"),
+        text(40, 344, "Zylinder"),
+        text(40, 360, "PoP Status"),
+        text(40, 374, "X Status 7 Status 9"),
+        text(40, 390, "1.jpg"),
+    ]
+    first += table(40, 410, [ITEM_HEADERS] + _item_rows(rng, "1.1", 8), ITEM_WIDTHS)
+    out = [first]
+    for i in range(1, pages):
+        section = i + 1
+        ops = [
+            text(40, 40, f"{section}. Abschnitt {section}"),
+            text(40, 60, f"{section}.1 Teil"),
+            text(40, 80, "PoP Status"),
+            text(60, 94, "Status 7"),
+            text(60, 110, "Status 9"),
+            rect(45, 86 if rng.random() < 0.5 else 102, 8, 8, fill=True),
+            text(40, 126, f"{section}.2 ZAS Schlüssel"),
+            text(40, 140, "X Schlüssel vorhanden"),
+        ]
+        ops += table(40, 160, [ITEM_HEADERS] + _item_rows(rng, f"{section}.2", 20), ITEM_WIDTHS)
+        out.append(ops)
+    return build_pdf(out)
+
+
+def _item_rows(rng, prefix, count):
+    rows = []
+    for k in range(1, count + 1):
+        column = rng.randrange(3)
+        rows.append([f"{prefix}.{k}", f"Pruefpunkt {k}"] + ["X" if c == column else "" for c in range(3)])
+    return rows
+
+
+def text_pdf(pages=12, lines=40, seed=0):
+    rng = random.Random(seed)
+    words = ["Max", "Mustermann", "wohnt", "in", "Berlin", "Strasse", "Kabel", "Glasfaser", "Anschluss", "Vertrag"]
+    out = []
+    for p in range(pages):
+        out.append(
+            [
+                text(40, 40 + 15 * line, f"Seite {p} Zeile {line} " + " ".join(rng.choice(words) for _ in range(9)))
+                for line in range(lines)
+            ]
+        )
+    return build_pdf(out)
+
+
+def tables_pdf(pages=6, rows=40, columns=6, seed=0):
+    rng = random.Random(seed)
+    widths = [80] * columns
+    out = []
+    for p in range(pages):
+        header = [f"Spalte {c}" for c in range(columns)]
+        body = [
+            [f"r{r}c{c}-{rng.randint(0, 999)}" if rng.random() < 0.9 else "" for c in range(columns)]
+            for r in range(rows)
+        ]
+        out.append(table(20, 30, [header] + body, widths, row_height=18))
+    return build_pdf(out)
+
+
+def images_pdf(pages=8, per_page=4, size=64, seed=0):
+    rng = random.Random(seed)
+    images = {}
+    out = []
+    for p in range(pages):
+        ops = [text(40, 40, f"Foto Seite {p}")]
+        for i in range(per_page):
+            name = f"Im{p}_{i}"
+            images[name] = (size, size, bytes(rng.getrandbits(8) for _ in range(size * size * 3)))
+            x = 40 + (i % 2) * 260
+            y = 120 + (i // 2) * 260
+            ops.append(f"q 240 0 0 240 {x} {PAGE_HEIGHT - y - 240} cm /{name} Do Q")
+        out.append(ops)
+    return build_pdf(out, images)
+
+
+CORPUS = {
+    "sitecheck": (sitecheck_pdf, 6),
+    "text": (text_pdf, 12),
+    "tables": (tables_pdf, 6),
+    "images": (images_pdf, 8),
+}
+
+
+def build_corpus():
+    # name -> (pdf bytes, page count)
+    return {name: (build(), pages) for name, (build, pages) in CORPUS.items()}
+
+
+def corpus_digest(corpus):
+    digest = hashlib.sha256()
+    for name in sorted(corpus):
+        digest.update(name.encode())
+        digest.update(corpus[name][0])
+    return digest.hexdigest()
@@ -0,0 +1,238 @@
+import argparse
+import atexit
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# Drives every route through the Flask test client against the synthetic
+# corpus and records latency percentiles, pages/s and peak RSS. Compare with
+# a stored baseline to catch regressions:
+#
+#   python benchmarks/run.py --output baseline.json
+#   python benchmarks/run.py --baseline baseline.json --threshold 0.25
+#
+# Exits 1 when a scenario is slower or larger than the baseline by more than
+# the threshold. Each scenario runs in a forked child so its peak RSS is its own.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_scratch = tempfile.mkdtemp(prefix="pdfplumber_bench_")
+atexit.register(shutil.rmtree, _scratch, True)
+# Results must be computed, not served from the result cache.
+os.environ.setdefault("RESULT_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("METRICS_DIR", os.path.join(_scratch, "metrics"))
+os.environ.setdefault("JOB_DIR", os.path.join(_scratch, "jobs"))
+
+import pdfplumber  # noqa: E402
+
+from app import API_KEY, app  # noqa: E402
+from corpus import build_corpus, corpus_digest  # noqa: E402
+from selection import page_indices, parse_page_ranges  # noqa: E402
+
+# name -> (route, corpus documents, form fields)
+SCENARIOS = {
+    "extract": ("/extract", ["text"], {}),
+    "extract_workers": ("/extract", ["text"], {"workers": "4"}),
+    "extract_pages": ("/extract", ["text"], {"pages": "1-5"}),
+    "extract_fast": ("/extract", ["text"], {"engine": "fast"}),
+    "extract_auto": ("/extract", ["text"], {"engine": "auto"}),
+    "extract_all": ("/extract-all", ["tables"], {}),
+    "extract_all_columnar": ("/extract-all", ["tables"], {"table_format": "columnar"}),
+    "extract_all_ndjson": ("/extract-all", ["text"], {"stream": "ndjson"}),
+    "sitecheck": ("/extract-sitecheck-protocol", ["sitecheck"], {}),
+    "sitecheck_site_info": ("/extract-sitecheck-protocol", ["sitecheck"], {"fields": "site_info"}),
+    "locate_words": ("/locate-words", ["text"], {"words": ["Mustermann", "Berlin Strasse", "Glasfaser"]}),
+    "redact": ("/redact", ["text"], {"fieldName": "wohnt", "words": ["Berlin"]}),
+    "debug_words": ("/debug-words", ["text"], {}),
+    "extract_images": ("/extract-images", ["images"], {}),
+    "extract_images_manifest": ("/extract-images", ["images"], {"format": "manifest"}),
+    "extract_images_zip": ("/extract-images", ["images"], {"format": "zip"}),
+    "batch_extract": ("/batch/extract", ["text", "sitecheck", "tables"], {"concurrency": "1"}),
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _current_rss():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _post(client, route, documents, fields, corpus):
+    data = dict(fields)
+    files = [(io.BytesIO(corpus[name][0]), f"{name}.pdf") for name in documents]
+    data["files" if route.startswith("/batch/") else "file"] = files if len(files) > 1 else files[0]
+    headers = {"x-api-key": API_KEY} if API_KEY else {}
+    started = time.perf_counter()
+    response = client.post(route, data=data, headers=headers)
+    body = response.get_data()
+    response.close()
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"{route} returned {response.status_code}: {body[:200]!r}")
+    return elapsed
+
+
+def run_scenario(name, corpus, iterations, warmup):
+    route, documents, fields = SCENARIOS[name]
+    client = app.test_client()
+    rss_start = _current_rss()
+    for _ in range(warmup):
+        _post(client, route, documents, fields, corpus)
+    timings = [_post(client, route, documents, fields, corpus) for _ in range(iterations)]
+    ranges = parse_page_ranges(fields.get("pages"))
+    pages = sum(len(page_indices(ranges, corpus[doc][1])) for doc in documents)
+    p50 = percentile(timings, 0.5)
+    peak = _peak_rss()
+    return {
+        "route": route,
+        "documents": documents,
+        "fields": fields,
+        "pages": pages,
+        "bytes": sum(len(corpus[doc][0]) for doc in documents),
+        "iterations": iterations,
+        "latency_ms": {
+            "min": round(min(timings) * 1000, 3),
+            "p50": round(p50 * 1000, 3),
+            "p90": round(percentile(timings, 0.9) * 1000, 3),
+            "p95": round(percentile(timings, 0.95) * 1000, 3),
+            "p99": round(percentile(timings, 0.99) * 1000, 3),
+            "max": round(max(timings) * 1000, 3),
+            "mean": round(sum(timings) / len(timings) * 1000, 3),
+        },
+        # Document pages per second at the median latency.
+        "pages_per_second": round(pages / p50, 3) if p50 else None,
+        "peak_rss_bytes": peak,
+        "rss_growth_bytes": max(0, peak - rss_start),
+    }
+
+
+def _child(conn, name, corpus, iterations, warmup):
+    try:
+        conn.send(("ok", run_scenario(name, corpus, iterations, warmup)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_isolated(name, corpus, iterations, warmup):
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(child, name, corpus, iterations, warmup))
+    process.start()
+    child.close()
+    status, payload = parent.recv()
+    process.join()
+    if status != "ok":
+        raise RuntimeError(f"{name}: {payload}")
+    return payload
+
+
+def compare(results, baseline, threshold, rss_threshold):
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50", "p95"):
+            old = previous["latency_ms"][metric]
+            new = current["latency_ms"][metric]
+            if old and new > old * (1 + threshold):
+                regressions.append(f"{name}: {metric} latency {old:.1f} ms -> {new:.1f} ms")
+        old_rss = previous.get("peak_rss_bytes")
+        new_rss = current["peak_rss_bytes"]
+        if old_rss and new_rss > old_rss * (1 + rss_threshold):
+            regressions.append(f"{name}: peak RSS {old_rss / 2**20:.1f} MiB -> {new_rss / 2**20:.1f} MiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every route against a synthetic PDF corpus.")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="compare against results previously written with --output")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed latency increase (0.25 = 25%%)")
+    parser.add_argument("--rss-threshold", type=float, help="allowed peak RSS increase (default: --threshold)")
+    parser.add_argument("--write-corpus", metavar="DIR", help="also write the corpus PDFs to DIR")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    corpus = build_corpus()
+    if args.write_corpus:
+        os.makedirs(args.write_corpus, exist_ok=True)
+        for name, (data, _) in corpus.items():
+            with open(os.path.join(args.write_corpus, f"{name}.pdf"), "wb") as fh:
+                fh.write(data)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "pdfplumber": pdfplumber.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus_digest": corpus_digest(corpus),
+        "scenarios": {},
+    }
+    for name in names:
+        result = run_isolated(name, corpus, args.iterations, args.warmup)
+        results["scenarios"][name] = result
+        latency = result["latency_ms"]
+        print(
+            f"{name:26} p50 {latency['p50']:9.1f} ms  p95 {latency['p95']:9.1f} ms"
+            f"  {result['pages_per_second']:8.1f} pages/s  peak RSS {result['peak_rss_bytes'] / 2**20:7.1f} MiB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    if baseline.get("corpus_digest") != results["corpus_digest"]:
+        print("warning: the corpus differs from the baseline's; results are not directly comparable")
+    if baseline.get("pdfplumber") != results["pdfplumber"]:
+        print(f"note: pdfplumber {baseline.get('pdfplumber')} -> {results['pdfplumber']}")
+    rss_threshold = args.threshold if args.rss_threshold is None else args.rss_threshold
+    regressions = compare(results, baseline, args.threshold, rss_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
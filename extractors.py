@@ -0,0 +1,179 @@
+import io
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter
+
+from images import page_images
+from metrics import metrics
+
+# pdfminer's own line grouping, without the text-box ordering pass.
+FAST_LAPARAMS = LAParams(boxes_flow=None, detect_vertical=False, all_texts=True)
+# A "word" this long means word gaps were missed and the text ran together.
+RUN_ON_WORD_CHARS = 40
+
+
+def page_text(page):
+    with metrics.time("extract_text"):
+        return page.extract_text() or ""
+
+
+def fast_page_text(page):
+    # Plain text straight from pdfminer's text converter, skipping the
+    # per-char objects pdfplumber builds; ~3x faster, lines only roughly ordered.
+    out = io.StringIO()
+    with metrics.time("extract_text_fast"):
+        device = TextConverter(page.pdf.rsrcmgr, out, laparams=FAST_LAPARAMS)
+        PDFPageInterpreter(page.pdf.rsrcmgr, device).process_page(page.page_obj)
+    lines = (line.rstrip() for line in out.getvalue().replace("\x0c", "").split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def looks_broken(text):
+    # Failures of pdfminer's grouping that the char-level pass copes with:
+    # words run together, or text broken up into a char per line.
+    words = text.split()
+    if not words:
+        return False
+    if sum(len(word) > RUN_ON_WORD_CHARS for word in words) > len(words) * 0.05:
+        return True
+    lines = text.split("\n")
+    return len(lines) >= 20 and sum(len(line.strip()) == 1 for line in lines) > len(lines) / 2
+
+
+def layout_text(page):
+    return page_text(page), "layout"
+
+
+def fast_text(page):
+    return fast_page_text(page), "fast"
+
+
+def auto_text(page):
+    text = fast_page_text(page)
+    if looks_broken(text):
+        return page_text(page), "layout"
+    return text, "fast"
+
+
+# engine -> page function returning (text, engine used)
+TEXT_ENGINES = {"layout": layout_text, "fast": fast_text, "auto": auto_text}
+
+
+def extract_words(page):
+    with metrics.time("extract_words"):
+        return page.extract_words(keep_blank_chars=True)
+
+
+def extract_tables(page):
+    with metrics.time("extract_tables"):
+        return page.extract_tables() or []
+
+
+def page_words(page):
+    return [
+        {"text": w["text"], "x0": float(w["x0"]), "top": float(w["top"]), "x1": float(w["x1"]), "bottom": float(w["bottom"])}
+        for w in extract_words(page)
+    ]
+
+
+ARTIFACTS = ("text", "tables", "words", "images")
+DEFAULT_ARTIFACTS = ("text", "tables")
+
+
+def page_artifacts(page, include=DEFAULT_ARTIFACTS):
+    # Only the requested artifacts are computed; a page whose tables are not
+    # wanted never runs table detection.
+    artifacts = {}
+    if "text" in include:
+        artifacts["text"] = page_text(page)
+    if "tables" in include:
+        artifacts["tables"] = extract_tables(page)
+    if "words" in include:
+        artifacts["words"] = page_words(page)
+    if "images" in include:
+        artifacts["images"] = page_images(page)
+    return artifacts
+
+
+TABLE_FORMATS = ("records", "columnar")
+
+
+def serialize_table(number, table, table_format="records"):
+    safe_table = [[cell or "" for cell in row] for row in table]
+    headers = safe_table[0]
+    rows = safe_table[1:]
+    if table_format == "columnar":
+        return {"table_number": number, "headers": headers, "rows": rows}
+    # Same shape as DataFrame(rows, columns=headers).to_dict("records"),
+    # including last-one-wins for duplicate header names.
+    return {"table_number": number, "headers": headers, "data": [dict(zip(headers, row)) for row in rows]}
+
+
+def extract_all_page(text, tables, table_format="records"):
+    page_tables = [serialize_table(i, table, table_format) for i, table in enumerate(tables, 1) if table]
+    elements = []
+    if text:
+        elements.append({"type": "text", "content": text})
+    for table in page_tables:
+        if table_format == "columnar":
+            # The columnar layout is already in "tables"; refer to it rather than repeat it.
+            elements.append({"type": "table", "table_number": table["table_number"]})
+        else:
+            elements.append(dict(table, type="table"))
+    return page_tables, elements
+
+
+COORDINATE_KEYS = frozenset(("x0", "top", "x1", "bottom"))
+
+
+def round_coordinates(items, decimals=None):
+    if decimals is None:
+        return items
+    return [
+        {key: round(value, decimals) if key in COORDINATE_KEYS else value for key, value in item.items()}
+        for item in items
+    ]
+
+
+def extract_all_record(page_num, artifacts, table_format="records", include=DEFAULT_ARTIFACTS, decimals=None):
+    record = {"page": page_num}
+    if "text" in include:
+        record["text"] = artifacts["text"]
+    if "tables" in include or "text" in include:
+        text = artifacts["text"] if "text" in include else ""
+        page_tables, elements = extract_all_page(text, artifacts.get("tables", []), table_format)
+        if "tables" in include:
+            record["tables"] = page_tables
+        record["elements"] = elements
+    for name in ("words", "images"):
+        if name in include:
+            record[name] = round_coordinates(artifacts[name], decimals)
+    return record
+
+
+def extract_all_result(pages, table_format="records", include=DEFAULT_ARTIFACTS, decimals=None):
+    # pages yields (page_index, artifacts) pairs.
+    result = {}
+    if "text" in include:
+        result["text"] = []
+    if "tables" in include:
+        result["tables"] = []
+    if "text" in include or "tables" in include:
+        result["combined"] = []
+    for name in ("words", "images"):
+        if name in include:
+            result[name] = []
+    for index, artifacts in pages:
+        record = extract_all_record(index + 1, artifacts, table_format, include, decimals)
+        page_num = record["page"]
+        if "text" in record:
+            result["text"].append({"page": page_num, "content": record["text"]})
+        if record.get("tables"):
+            result["tables"].append({"page": page_num, "tables": record["tables"]})
+        if "elements" in record:
+            result["combined"].append({"page": page_num, "elements": record["elements"]})
+        for name in ("words", "images"):
+            if name in record:
+                result[name].append({"page": page_num, name: record[name]})
+    return result
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import re
+
+PROTOCOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "protocols")
+
+
+class LineMatcher:
+    # All rules are compiled into one regex of optional lookaheads, so a
+    # single match() call per line reports every rule that hits it along
+    # with that rule's capture groups. Rule patterns use search semantics
+    # (anchor with ^) and must not use named groups.
+    def __init__(self, rules, ignore_case=False):
+        parts = []
+        self._rules = []
+        group = 1
+        for name, pattern in rules:
+            # Anchored rules skip the scan prefix instead of failing at every offset.
+            prefix = "" if pattern.startswith(("^", "(?i:^")) else ".*?"
+            if ignore_case:
+                pattern = f"(?i:{pattern})"
+            parts.append(f"(?:(?={prefix}({pattern})))?")
+            groups = re.compile(pattern).groups
+            self._rules.append((name, group, groups))
+            group += 1 + groups
+        self._regex = re.compile("".join(parts))
+
+    def match(self, line):
+        found = self._regex.match(line)
+        spans = found.regs
+        groups = found.groups()
+        return {name: groups[group : group + count] for name, group, count in self._rules if spans[group][0] != -1}
+
+
+def _values_line(lines, index, step):
+    # The nearest non-blank line before (step=-1) or after (step=1) index,
+    # stripped. Like a multi-line regex, a whitespace-only line still counts
+    # as an (empty) value when nothing else follows it.
+    fallback = None
+    index += step
+    while 0 <= index < len(lines):
+        if lines[index].strip():
+            return lines[index].strip()
+        if lines[index]:
+            fallback = ""
+        index += step
+    return fallback
+
+
+class FormTemplate:
+    def __init__(self, spec):
+        self.name = spec["name"]
+        # Identifies this exact spec, e.g. in result cache keys.
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+        header = spec["header"]
+        self.header_lines = header.get("max_lines", 10)
+        self.header_rules = header["rules"]
+        self.header_matcher = LineMatcher((i, rule["pattern"]) for i, rule in enumerate(self.header_rules))
+
+        site_info = spec["site_info"]
+        ignore_case = site_info.get("ignore_case", False)
+        self.site_fields = [
+            dict(field, value=re.compile(field["value"], re.IGNORECASE if ignore_case else 0))
+            for field in site_info["fields"]
+        ]
+        self.site_matcher = LineMatcher(
+            ((i, field["label"]) for i, field in enumerate(self.site_fields)), ignore_case=ignore_case
+        )
+        self.status = site_info["status"]
+
+        sections = spec["sections"]
+        self.checkbox_groups = sections["checkbox_groups"]
+        self.line_matcher = LineMatcher(
+            [(name, sections[name]) for name in ("section", "subsection", "image", "required_field")]
+            + [(i, group["trigger"]) for i, group in enumerate(self.checkbox_groups)]
+        )
+
+        self.item_table = dict(spec["item_table"], item=re.compile(spec["item_table"]["item"]))
+
+    def parse_header(self, lines):
+        header = {}
+        for line in lines[: self.header_lines]:
+            line = line.strip()
+            for index, groups in self.header_matcher.match(line).items():
+                rule = self.header_rules[index]
+                if "split" in rule:
+                    parts = line.split(rule["split"])
+                    header.update((key, part.strip()) for key, part in zip(rule["fields"], parts))
+                else:
+                    header.update(zip(rule["fields"], groups))
+        return header
+
+    def parse_site_fields(self, lines):
+        # First occurrence wins, as with a search over the page text.
+        site_info = {}
+        for line_idx, line in enumerate(lines):
+            for index in self.site_matcher.match(line):
+                field = self.site_fields[index]
+                if field["key"] in site_info:
+                    continue
+                value_line = _values_line(lines, line_idx, -1 if field.get("value_line") == "previous" else 1)
+                match = field["value"].search(value_line) if value_line is not None else None
+                if match:
+                    site_info[field["key"]] = match.group(1).strip()
+        return {field["key"]: site_info[field["key"]] for field in self.site_fields if field["key"] in site_info}
+
+    def parse_checkbox_group(self, group, lines, line_idx, on_unmarked=None):
+        # Returns (key, value) for the group triggered at lines[line_idx], or
+        # None when nothing is checked. on_unmarked(group) resolves an option
+        # line whose checkbox was not extracted as text.
+        stop = min(line_idx + 1 + group["lookahead"], len(lines))
+        markers = group["markers"]
+        if group["kind"] == "option_line":
+            for i in range(line_idx + 1, stop):
+                if any(option in lines[i] for option in group["options"]):
+                    option_line = lines[i]
+                    if not any(marker in option_line for marker in markers):
+                        value = on_unmarked(group) if on_unmarked else None
+                        return (group["key"], value) if value else None
+                    for option in group["options"]:
+                        if option in option_line and any(
+                            marker in option_line.split(option)[0] for marker in markers
+                        ):
+                            return group["key"], option
+                    return None
+            return None
+
+        key = group["key"]
+        for text, alternative in group.get("key_when", ()):
+            if text in lines[line_idx]:
+                key = alternative
+                break
+        for i in range(line_idx + 1, stop):
+            option_line = lines[i]
+            if group["option_contains"] in option_line and any(marker in option_line for marker in markers):
+                for marker in markers:
+                    option_line = option_line.replace(marker, "")
+                return key, option_line.strip()
+        return None
+
+    def table_columns(self, headers):
+        # Maps each status to its column index, or None when the table is
+        # not an item table.
+        spec = self.item_table
+        if not any(all(text in str(h) for text in spec["header_contains"]) for h in headers):
+            return None
+        columns = {column["status"]: None for column in spec["columns"]}
+        for i, header in enumerate(headers):
+            header_str = str(header) if header else ""
+            for column in spec["columns"]:
+                if header_str in column.get("header_equals", ()) or any(
+                    text in header_str for text in column.get("header_contains", ())
+                ):
+                    columns[column["status"]] = i
+                    break
+        return columns
+
+    def row_status(self, row, columns):
+        spec = self.item_table
+        status = spec["default_status"]
+        for column in spec["columns"]:
+            col = columns[column["status"]]
+            if col is not None and len(row) > col:
+                cell_content = str(row[col]).strip()
+                if cell_content and cell_content not in column["placeholders"]:
+                    status = column["status"]
+        if status == spec["default_status"]:
+            markers = spec["markers"]
+            for i, cell in enumerate(row):
+                if any(marker in str(cell) for marker in markers):
+                    for column in spec["columns"]:
+                        if columns[column["status"]] == i:
+                            status = column["status"]
+                            break
+                    break
+        return status
+
+
+def load_template(path):
+    with open(path, encoding="utf-8") as fh:
+        return FormTemplate(json.load(fh))
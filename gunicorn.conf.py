@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+
+from admission import ADMISSION_CLASSES
+
+# Loaded automatically by gunicorn from the working directory. Every setting
+# can still be overridden on the command line or with GUNICORN_CMD_ARGS.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 9546)}"
+
+# Extraction is CPU-bound: one process per core does the work, threads only
+# hold admitted requests, queued requests and the cheap GET routes.
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(
+    os.environ.get(
+        "GUNICORN_THREADS",
+        sum(concurrency + queue for concurrency, queue, *_ in ADMISSION_CLASSES.values()) + 2,
+    )
+)
+
+# Import once in the master and fork, so workers share its pages copy-on-write.
+preload_app = True
+
+# Recycle workers to hand back memory that fragmentation keeps from the OS.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 500))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 50))
+
+# gthread workers heartbeat from their main loop, so this bounds hung
+# workers, not long requests.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 60))
+keepalive = 5
+# Heartbeat files on tmpfs so a slow disk cannot make workers look hung.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def on_starting(server):
+    # Metric files of the previous run would otherwise be summed forever.
+    from metrics import metrics
+
+    metrics.clear()
@@ -0,0 +1,247 @@
+import base64
+import hashlib
+import json
+import mimetypes
+import zipfile
+
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import PSLiteral, PSKeyword
+
+from metrics import metrics
+from selection import selected_pages
+from time_budget import TIMED_OUT, guarded
+
+DEDUPE_MODES = ("name", "object", "hash")
+
+
+def _literal_name(val):
+    if isinstance(val, (PSLiteral, PSKeyword)):
+        return val.name
+    if isinstance(val, bytes):
+        return val.decode("latin-1")
+    return str(val)
+
+
+def _stream_filters(stream):
+    filters = stream.attrs.get("Filter")
+    if not filters:
+        return []
+    filters = resolve1(filters)
+    if isinstance(filters, list):
+        return [_literal_name(f) for f in filters]
+    return [_literal_name(filters)]
+
+
+def image_ext(stream):
+    for flt in _stream_filters(stream):
+        if flt == "DCTDecode":
+            return "jpg"
+        if flt == "JPXDecode":
+            return "jp2"
+        if flt in ("CCITTFaxDecode", "CCFDecode"):
+            return "tiff"
+        if flt in ("FlateDecode", "LZWDecode"):
+            return "png"
+    return "bin"
+
+
+try:
+    from pdfplumber.utils import extract_image
+except ImportError:
+
+    def extract_image(obj):
+        stream = obj.get("stream")
+        if stream is None:
+            return {"image": None, "ext": None}
+        stream = resolve1(stream)
+        return {"image": stream.get_data(), "ext": image_ext(stream)}
+
+
+def _raw_stream_bytes(stream):
+    # pdfminer drops rawdata once a stream has been decoded.
+    raw = stream.get_rawdata()
+    return raw if raw is not None else stream.get_data()
+
+
+def page_images(page):
+    # Manifest entries (no image bytes) with the placement of every image
+    # drawn on one page.
+    found = []
+    for img in page.images:
+        name = img.get("name")
+        stream = img.get("stream")
+        if not name or stream is None:
+            continue
+        stream = resolve1(stream)
+        raw = _raw_stream_bytes(stream)
+        found.append(
+            {
+                "name": name,
+                "ext": image_ext(stream),
+                "size": len(raw),
+                "hash": hashlib.sha256(raw).hexdigest(),
+                "x0": float(img["x0"]),
+                "top": float(img["top"]),
+                "x1": float(img["x1"]),
+                "bottom": float(img["bottom"]),
+            }
+        )
+    return found
+
+
+def _stream_digest(stream, objid, digests):
+    # SHA-256 of the encoded stream, memoized per PDF object. Direct streams
+    # have no object id to key on; id() may be reused once a page is freed.
+    if objid is not None and objid in digests:
+        return digests[objid]
+    digest = hashlib.sha256(_raw_stream_bytes(stream)).hexdigest()
+    if objid is not None:
+        digests[objid] = digest
+    return digest
+
+
+def _page_image_records(page, page_num, dedupe, decode, hashes, seen, digests):
+    # The records of one page, deduplicated against `seen`, which is only
+    # updated by the caller once the page finished.
+    records = []
+    page_seen = set()
+    for img in page.images:
+        name = img.get("name")
+        stream = img.get("stream")
+        if not name or stream is None:
+            continue
+        stream = resolve1(stream)
+
+        objid = getattr(stream, "objid", None)
+        digest = None
+        if hashes or dedupe == "hash" or (dedupe == "object" and objid is None):
+            digest = _stream_digest(stream, objid, digests)
+
+        if dedupe == "object" and objid is not None:
+            key = ("object", objid)
+        elif dedupe in ("object", "hash"):
+            key = ("hash", digest)
+        else:
+            key = ("name", name)
+        if key in seen or key in page_seen:
+            continue
+        page_seen.add(key)
+
+        record = {"page": page_num, "name": name, "ext": image_ext(stream), "size": len(_raw_stream_bytes(stream))}
+        if hashes:
+            record["hash"] = digest
+        if decode:
+            with metrics.time("decode_images"):
+                extracted = extract_image(img)
+            img_bytes = extracted.get("image")
+            if not img_bytes:
+                continue
+            record["ext"] = extracted.get("ext") or "bin"
+            record["data"] = img_bytes
+        records.append(record)
+    return records, page_seen
+
+
+def iter_pdf_images(pdf, dedupe="name", decode=True, pages=None, hashes=True):
+    # Yields one record per distinct image: page, name, ext, size (encoded
+    # stream bytes) and, when hashes is true, hash (SHA-256 of the encoded
+    # stream), plus the extracted bytes under "data" when decode is true. dedupe picks what
+    # counts as "the same image": the XObject name, the underlying PDF
+    # stream object, or the stream content. pages restricts the scan to
+    # the given page ranges. Each page runs under the page time budget; an
+    # interrupted page yields nothing and is reported as timed out.
+    seen = set()
+    digests = {}
+    for index, page in selected_pages(pdf, pages):
+        result = guarded(index, _page_image_records, page, index + 1, dedupe, decode, hashes, seen, digests)
+        if result is TIMED_OUT:
+            continue
+        records, page_seen = result
+        seen.update(page_seen)
+        yield from records
+
+
+def json_record(record):
+    return {
+        "page": record["page"],
+        "name": record["name"],
+        "ext": record["ext"],
+        "data_base64": base64.b64encode(record["data"]).decode("utf-8"),
+    }
+
+
+def manifest_record(record, filename=None):
+    entry = {key: record[key] for key in ("page", "name", "ext", "size", "hash")}
+    if filename:
+        entry["file"] = filename
+    return entry
+
+
+def image_filename(index, record):
+    return f"{index:04d}_p{record['page']}_{record['name']}.{record['ext']}"
+
+
+def image_mimetype(ext):
+    return mimetypes.guess_type(f"image.{ext}")[0] or "application/octet-stream"
+
+
+class _ChunkWriter:
+    # Write-only, unseekable sink so zipfile streams entries with data
+    # descriptors instead of seeking back into what was already sent.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b"".join(chunks)
+
+
+def manifest_document(manifest, report=None):
+    # The time budget report, if any, marks the archive as partial since
+    # the status and headers were sent before it was known.
+    report = report() if report is not None else {}
+    if report:
+        return dict({"images": manifest, "partial": True}, **report)
+    return {"images": manifest}
+
+
+def iter_zip(records, report=None):
+    sink = _ChunkWriter()
+    manifest = []
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for index, record in enumerate(records, 1):
+            filename = image_filename(index, record)
+            archive.writestr(filename, record["data"])
+            manifest.append(manifest_record(record, filename))
+            yield sink.drain()
+        archive.writestr("manifest.json", json.dumps(manifest_document(manifest, report)))
+    yield sink.drain()
+
+
+def iter_multipart(records, boundary, report=None):
+    manifest = []
+    for index, record in enumerate(records, 1):
+        filename = image_filename(index, record)
+        manifest.append(manifest_record(record, filename))
+        head = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {image_mimetype(record['ext'])}\r\n"
+            f'Content-Disposition: attachment; filename="{filename}"\r\n'
+            f"Content-Length: {len(record['data'])}\r\n\r\n"
+        )
+        yield head.encode("utf-8") + record["data"] + b"\r\n"
+    tail = (
+        f"--{boundary}\r\n"
+        "Content-Type: application/json\r\n"
+        'Content-Disposition: inline; filename="manifest.json"\r\n\r\n'
+        f"{json.dumps(manifest_document(manifest, report))}\r\n"
+        f"--{boundary}--\r\n"
+    )
+    yield tail.encode("utf-8")
@@ -0,0 +1,97 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+
+import pdfplumber
+
+from metrics import metrics
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", 8 * 1024 * 1024))
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, size, limit):
+        super().__init__(f"Upload of {size} bytes exceeds the limit of {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+class Upload:
+    # A private, seekable copy of an uploaded PDF that outlives the request.
+    # Small uploads live in a BytesIO; large ones in a uniquely named file
+    # that is memory-mapped. close() releases both, except a file the Upload
+    # does not own (owns_path=False), which is left in place.
+    def __init__(self, stream, size, path=None, owns_path=True):
+        self.stream = stream
+        self.size = size
+        self.path = path
+        self.owns_path = owns_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def ensure_path(self):
+        # Worker processes need a file they can open themselves.
+        if self.path is None:
+            fd, path = tempfile.mkstemp(prefix="pdfplumber_upload_", suffix=".pdf")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(self.stream.getbuffer())
+            self.path = path
+        return self.path
+
+    def close(self):
+        if not self.stream.closed:
+            self.stream.close()
+        if self.path is not None and self.owns_path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+def _stream_size(stream):
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def ingest_upload(file_storage, max_bytes=None, spool_bytes=None):
+    with metrics.time("ingest"):
+        upload = _ingest(file_storage, max_bytes, spool_bytes)
+    metrics.observe("pdf_upload_bytes", upload.size)
+    return upload
+
+
+def _ingest(file_storage, max_bytes=None, spool_bytes=None):
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    spool_bytes = UPLOAD_SPOOL_BYTES if spool_bytes is None else spool_bytes
+    source = getattr(file_storage, "stream", file_storage)
+    size = _stream_size(source)
+    if max_bytes and size > max_bytes:
+        raise UploadTooLarge(size, max_bytes)
+    if size <= spool_bytes:
+        return Upload(io.BytesIO(source.read()), size)
+
+    fd, path = tempfile.mkstemp(prefix="pdfplumber_upload_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            shutil.copyfileobj(source, fh)
+        with open(path, "rb") as fh:
+            mapping = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        os.remove(path)
+        raise
+    return Upload(mapping, size, path=path)
+
+
+def open_pdf(source, **kwargs):
+    with metrics.time("open"):
+        return pdfplumber.open(source, **kwargs)
@@ -0,0 +1,314 @@
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from ingest import Upload
+from metrics import metrics
+
+JOB_DIR = os.environ.get("JOB_DIR") or os.path.join(tempfile.gettempdir(), "pdfplumber_jobs")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", 100))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 3600))
+# A running job whose worker has not renewed its lease for this long is
+# taken to be orphaned (worker recycled or killed) and is run again, up to
+# JOB_MAX_ATTEMPTS times in all; then it is marked failed.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 2))
+# How often idle job threads look for queued jobs submitted to other workers.
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 1))
+
+PENDING_STATUSES = ("queued", "running")
+STATUS_COLUMNS = (
+    "id, type, status, params, input_path, input_size, pages_done, pages_total, error, created, updated, finished"
+)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def track_progress(pages, total, progress):
+    progress(0, total)
+    for done, page in enumerate(pages, 1):
+        progress(done, total)
+        yield page
+
+
+class JobStore:
+    # SQLite-backed, so every gunicorn worker sees every job.
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " type TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " input_path TEXT,"
+                " input_size INTEGER,"
+                " pages_done INTEGER NOT NULL DEFAULT 0,"
+                " pages_total INTEGER,"
+                " error TEXT,"
+                " result BLOB,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL,"
+                " finished REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (
+                ("owner", "TEXT"),
+                ("lease_until", "REAL"),
+                ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def create(self, job_id, job_type, params, input_path, input_size):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, type, status, params, input_path, input_size, created, updated)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(params), input_path, input_size, now, now),
+            )
+
+    def update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id, with_result=False):
+        columns = "*" if with_result else STATUS_COLUMNS
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, owner, lease_seconds, max_attempts):
+        # Atomically takes the oldest queued job, or a running one whose lease
+        # has expired, for `owner`; returns its id or None. Orphaned jobs that
+        # have used up their attempts are failed first.
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished = ?, updated = ?"
+                    " WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?) AND attempts >= ?",
+                    ("Job was interrupted too many times", now, now, now, max_attempts),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued'"
+                    " OR (status = 'running' AND (lease_until IS NULL OR lease_until < ?))"
+                    " ORDER BY created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, attempts = attempts + 1,"
+                        " pages_done = 0, updated = ? WHERE id = ?",
+                        (owner, now + lease_seconds, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return row[0] if row is not None else None
+
+    def renew(self, owner, lease_seconds):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, owner),
+            )
+
+    def pending_count(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", PENDING_STATUSES
+            ).fetchone()[0]
+
+    def evict_finished(self, ttl):
+        cutoff = time.time() - ttl
+        with self._connect() as conn:
+            paths = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT input_path FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,)
+                )
+                if row[0]
+            ]
+            conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,))
+        return paths
+
+
+class JobManager:
+    # Jobs are queued in the store, not in memory. The web workers only
+    # submit and poll; the job worker process (`python -m jobs`, kept apart
+    # so gunicorn's recycling cannot kill long jobs and jobs do not compete
+    # with admitted requests for the GIL) runs `workers` threads that claim
+    # queued jobs and keeps the leases of the jobs it runs alive. Jobs of a
+    # job worker that exits are picked up again once their lease runs out.
+    def __init__(self, store, job_dir=JOB_DIR, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING,
+                 result_ttl=JOB_RESULT_TTL, dumps=json.dumps, lease_seconds=JOB_LEASE_SECONDS,
+                 max_attempts=JOB_MAX_ATTEMPTS, poll_seconds=JOB_POLL_SECONDS):
+        self.store = store
+        self.job_dir = job_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.dumps = dumps
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.handlers = {}
+        self._pid = None
+        self._owner = None
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        os.makedirs(job_dir, exist_ok=True)
+
+    def register(self, job_type, handler):
+        # handler(upload, params, progress) -> JSON-serializable result, where
+        # progress(pages_done, pages_total) may be called as pages complete.
+        self.handlers[job_type] = handler
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._owner = f"{self._pid}-{uuid.uuid4().hex}"
+            self._stopping = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"job-{i}", daemon=True) for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            threading.Thread(target=self._keep_leases, name="job-leases", daemon=True).start()
+
+    def stop(self):
+        # Running jobs are finished; no new ones are claimed.
+        self._stopping.set()
+
+    def run(self):
+        # Runs jobs until SIGTERM/SIGINT, then waits for the running ones.
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+        self.start()
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(1)
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job_id = self.store.claim(self._owner, self.lease_seconds, self.max_attempts)
+            except sqlite3.Error:
+                import traceback
+
+                traceback.print_exc()
+                job_id = None
+            if job_id is None:
+                self._stopping.wait(self.poll_seconds)
+                continue
+            self._run(job_id)
+
+    def _keep_leases(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self.store.renew(self._owner, self.lease_seconds)
+            except sqlite3.Error:
+                import traceback
+
+                traceback.print_exc()
+
+    def evict_expired(self):
+        for path in self.store.evict_finished(self.result_ttl):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, job_type, upload, params):
+        self.evict_expired()
+        if self.max_pending and self.store.pending_count() >= self.max_pending:
+            raise JobQueueFull(f"Job queue is full ({self.max_pending} pending jobs)")
+        job_id = uuid.uuid4().hex
+        input_path = os.path.join(self.job_dir, f"{job_id}.pdf")
+        upload.stream.seek(0)
+        with open(input_path, "wb") as fh:
+            shutil.copyfileobj(upload.stream, fh)
+        self.store.create(job_id, job_type, params, input_path, upload.size)
+        return job_id
+
+    def get(self, job_id):
+        self.evict_expired()
+        return self.store.get(job_id)
+
+    def result(self, job_id):
+        return self.store.get(job_id, with_result=True)
+
+    def _run(self, job_id):
+        job = self.store.get(job_id)
+        last_update = [0.0]
+
+        def progress(done, total):
+            now = time.monotonic()
+            if done == 0 or done == total or now - last_update[0] >= 0.5:
+                last_update[0] = now
+                self.store.update(job_id, pages_done=done, pages_total=total)
+
+        upload = None
+        try:
+            upload = Upload(open(job["input_path"], "rb"), job["input_size"], path=job["input_path"])
+            result = self.handlers[job["type"]](upload, json.loads(job["params"]), progress)
+            body = self.dumps(result)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            current = self.store.get(job_id)
+            pages_total = current["pages_total"]
+            self.store.update(
+                job_id,
+                status="done",
+                result=body,
+                pages_done=pages_total if pages_total is not None else current["pages_done"],
+                finished=time.time(),
+            )
+        except Exception as e:
+            import traceback
+
+            traceback.print_exc()
+            self.store.update(job_id, status="failed", error=str(e), finished=time.time())
+        finally:
+            if upload is not None:
+                upload.close()
+            metrics.flush()
+
+
+if __name__ == "__main__":
+    # The job worker process; the handlers are registered by the app.
+    from app import job_manager
+
+    job_manager.run()
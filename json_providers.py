@@ -0,0 +1,59 @@
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# "auto" uses orjson when it is installed and the stdlib encoder otherwise.
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "auto")
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    name = "stdlib"
+
+    def dumps(self, obj, **kwargs):
+        with metrics.time("json_serialize"):
+            return super().dumps(obj, **kwargs)
+
+
+class OrjsonJSONProvider(DefaultJSONProvider):
+    # Same documents as the stdlib provider (sorted keys, compact unless
+    # debugging) several times faster. Non-ASCII text is written as UTF-8
+    # rather than \u escapes, and NaN/Infinity become null.
+    name = "orjson"
+
+    def _dumps(self, obj, indent=False):
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        with metrics.time("json_serialize"):
+            return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj, indent=bool(kwargs.get("indent"))).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._dumps(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {provider.name: provider for provider in (TimedJSONProvider, OrjsonJSONProvider)}
+
+
+def json_provider(app, encoder=JSON_ENCODER):
+    if encoder == "auto":
+        encoder = "orjson" if orjson is not None else "stdlib"
+    if encoder not in JSON_PROVIDERS:
+        raise ValueError(f"JSON_ENCODER must be one of auto, {', '.join(JSON_PROVIDERS)}")
+    if encoder == "orjson" and orjson is None:
+        raise ValueError("JSON_ENCODER=orjson but orjson is not installed")
+    return JSON_PROVIDERS[encoder](app)
@@ -0,0 +1,100 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+
+LAYOUT_CACHE_SIZE = int(os.environ.get("LAYOUT_CACHE_SIZE", 64))
+# Points added around a learned box before cropping; a result that comes
+# closer than EDGE_MARGIN to a crop edge may have been cut off.
+CROP_PADDING = 4
+EDGE_MARGIN = 1
+
+
+def layout_fingerprint(width, height, chars, page_number=None):
+    # Cheap features that tell pages of one form layout apart: page size,
+    # the text of the topmost line and the order of magnitude of its chars.
+    # The page number keeps the pages of one form apart when they share a
+    # running header, so each learns its own boxes instead of overwriting
+    # those of the page before.
+    if not chars:
+        return None
+    top = min(char["top"] for char in chars)
+    first_line = sorted((char for char in chars if char["top"] - top < 1), key=lambda char: char["x0"])
+    return (
+        round(width),
+        round(height),
+        "".join(char["text"] for char in first_line),
+        int(math.log2(len(chars))),
+        page_number,
+    )
+
+
+def padded(bbox, page_bbox, padding=CROP_PADDING):
+    x0, top, x1, bottom = bbox
+    p_x0, p_top, p_x1, p_bottom = page_bbox
+    return (
+        max(p_x0, x0 - padding),
+        max(p_top, top - padding),
+        min(p_x1, x1 + padding),
+        min(p_bottom, bottom + padding),
+    )
+
+
+def inside(bbox, crop_bbox, page_bbox, margin=EDGE_MARGIN):
+    # Crop edges that coincide with the page edge cannot cut anything off.
+    x0, top, x1, bottom = bbox
+    c_x0, c_top, c_x1, c_bottom = crop_bbox
+    p_x0, p_top, p_x1, p_bottom = page_bbox
+    return (
+        (c_x0 == p_x0 or x0 - c_x0 >= margin)
+        and (c_top == p_top or top - c_top >= margin)
+        and (c_x1 == p_x1 or c_x1 - x1 >= margin)
+        and (c_bottom == p_bottom or c_bottom - bottom >= margin)
+    )
+
+
+class LayoutCache:
+    # Learned page geometry by layout fingerprint: for each known layout, the
+    # boxes of its tables and of the labels that were searched for. Entries
+    # are filled in as full-page analysis runs and evicted least recently used.
+    def __init__(self, max_entries=LAYOUT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._reset_lock()
+        self.stats = {"hits": 0, "misses": 0, "fallbacks": 0}
+        # Shard processes fork from threaded web workers and may have copied
+        # the lock while another thread held it.
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.stats["hits"] += 1
+            return dict(entry)
+
+    def learn(self, fingerprint, key, value):
+        with self._lock:
+            entry = self._entries.setdefault(fingerprint, {})
+            entry[key] = value
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def fallback(self):
+        with self._lock:
+            self.stats["fallbacks"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries)
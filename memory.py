@@ -0,0 +1,105 @@
+import contextvars
+import gc
+import os
+
+from metrics import metrics
+
+# RSS a single request may add to its worker; 0 disables the budget. Past
+# MEMORY_LEAN_FRACTION of it the request switches to lean mode and drops the
+# document-wide object caches after every page. Growth is measured for the
+# whole process, so a request may be charged for its neighbours' pages; it
+# is only failed with 413 past the budget when REQUEST_MEMORY_BUDGET_ENFORCE
+# is set.
+REQUEST_MEMORY_BUDGET_BYTES = int(os.environ.get("REQUEST_MEMORY_BUDGET_BYTES", 1024 * 1024 * 1024))
+MEMORY_LEAN_FRACTION = float(os.environ.get("MEMORY_LEAN_FRACTION", 0.75))
+REQUEST_MEMORY_BUDGET_ENFORCE = bool(int(os.environ.get("REQUEST_MEMORY_BUDGET_ENFORCE", 0)))
+
+
+class MemoryBudgetExceeded(Exception):
+    def __init__(self, used, limit):
+        self.used = used
+        self.limit = limit
+        super().__init__(
+            f"Processing needed more than {round(limit / 2**20, 1):g} MiB; "
+            "select fewer pages or submit the document as a job"
+        )
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def release_document(pdf):
+    # pdfminer keeps every object it has parsed (content streams included)
+    # for the life of the document; pages re-read what they need.
+    doc = getattr(pdf, "doc", None)
+    for name in ("_cached_objs", "_parsed_objs"):
+        cache = getattr(doc, name, None)
+        if isinstance(cache, dict):
+            cache.clear()
+    gc.collect()
+
+
+class MemoryBudget:
+    # Growth is measured against the worker's RSS when the request started.
+    # RSS is per process, so requests sharing a threaded worker are charged
+    # for each other's pages; size the budget with that in mind.
+    def __init__(self, limit=REQUEST_MEMORY_BUDGET_BYTES, lean_fraction=MEMORY_LEAN_FRACTION,
+                 enforce=REQUEST_MEMORY_BUDGET_ENFORCE):
+        self.limit = limit
+        self.lean_at = limit * lean_fraction
+        self.enforce = enforce
+        self.start = current_rss()
+        self.lean = False
+
+    def check(self, pdf=None):
+        rss = current_rss()
+        if not rss or not self.start:
+            return
+        if rss - self.start < self.lean_at:
+            return
+        if not self.lean:
+            self.lean = True
+            metrics.inc("pdf_memory_budget_events_total", event="lean")
+        if pdf is not None:
+            release_document(pdf)
+        else:
+            gc.collect()
+        if not self.enforce:
+            return
+        used = current_rss() - self.start
+        if used > self.limit:
+            metrics.inc("pdf_memory_budget_events_total", event="exceeded")
+            raise MemoryBudgetExceeded(used, self.limit)
+
+
+_budget = contextvars.ContextVar("memory_budget", default=None)
+
+
+def start_budget(limit=REQUEST_MEMORY_BUDGET_BYTES):
+    _budget.set(MemoryBudget(limit) if limit > 0 else None)
+
+
+def end_budget():
+    _budget.set(None)
+
+
+def budgeted(items, limit=REQUEST_MEMORY_BUDGET_BYTES):
+    # Streamed bodies are produced after the request's teardown has ended
+    # its budget, so the stream gets one of its own.
+    start_budget(limit)
+    try:
+        yield from items
+    finally:
+        end_budget()
+
+
+def check_budget(pdf=None):
+    # Called at page boundaries; a no-op outside a budgeted request.
+    budget = _budget.get()
+    if budget is not None:
+        budget.check(pdf)
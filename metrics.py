@@ -0,0 +1,254 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(tempfile.gettempdir(), "pdfplumber_metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (10_000, 100_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000, 100_000_000)
+
+# name -> (type, help, histogram buckets)
+METRIC_DEFINITIONS = {
+    "pdf_requests_total": ("counter", "Requests handled, by endpoint and status code.", None),
+    "pdf_request_errors_total": ("counter", "Requests that failed with a server error, by endpoint.", None),
+    "pdf_request_duration_seconds": (
+        "histogram",
+        "Time from request start until the response is closed, streaming included.",
+        LATENCY_BUCKETS,
+    ),
+    "pdf_stage_duration_seconds": ("histogram", "Time spent per processing stage.", LATENCY_BUCKETS),
+    "pdf_pages_processed_total": ("counter", "PDF pages processed; rate() gives pages per second.", None),
+    "pdf_memory_budget_events_total": (
+        "counter",
+        "Requests that switched to lean mode or were failed for exceeding the memory budget.",
+        None,
+    ),
+    "pdf_admission_rejected_total": ("counter", "Requests turned away by admission control, by reason.", None),
+    "pdf_admission_wait_seconds": ("histogram", "Time requests waited for an admission slot.", LATENCY_BUCKETS),
+    "pdf_upload_bytes": ("histogram", "Size of ingested PDF uploads.", SIZE_BUCKETS),
+}
+
+
+# Samples of exited processes, summed.
+AGGREGATE_FILE = "aggregate.json"
+
+
+def _alive(filename):
+    # Sample files are named <pid>-<random>.json.
+    try:
+        os.kill(int(filename.split("-", 1)[0]), 0)
+    except ValueError:
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Collector:
+    # Each process accumulates its own samples and writes them to a file of
+    # its own in `directory`; render() sums every file there, so counters and
+    # histograms add up across gunicorn workers and page-worker processes.
+    # Files of exited processes are folded into one aggregate file so totals
+    # stay monotonic; the gunicorn master clears the directory on start.
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked child must not re-report what its parent already counted,
+        # and may have copied the lock while another thread held it.
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._path = os.path.join(self.directory, f"{self._pid}-{uuid.uuid4().hex}.json")
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRIC_DEFINITIONS[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            counts = histogram[0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            histogram[1] += value
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("pdf_stage_duration_seconds", time.perf_counter() - started, stage=stage)
+
+    def flush(self):
+        with self._lock:
+            if not self._counters and not self._histograms:
+                return
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+            path = self._path
+        self._write(path, counters, histograms)
+
+    def _write(self, path, counters, histograms, **extra):
+        data = dict(
+            extra,
+            counters=[[name, labels, value] for (name, labels), value in counters.items()],
+            histograms=[[name, labels, counts, total] for (name, labels), (counts, total) in histograms.items()],
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def _directory_lock(self, exclusive):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def clear(self):
+        # Drops every process's samples, e.g. when the service starts.
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for filename in names:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+
+    def _read(self, filenames):
+        counters = {}
+        histograms = {}
+        for filename in filenames:
+            try:
+                with open(os.path.join(self.directory, filename)) as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in data["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in data["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, histograms
+
+    def _sample_files(self):
+        try:
+            return [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+
+    def _compact(self):
+        # Folds the files of exited processes into AGGREGATE_FILE. The names
+        # folded in are recorded in it until the files are gone, so a crash
+        # between writing it and removing them cannot count them twice.
+        dead = [name for name in self._sample_files() if name != AGGREGATE_FILE and not _alive(name)]
+        if not dead:
+            return
+        with self._directory_lock(exclusive=True):
+            aggregate_path = os.path.join(self.directory, AGGREGATE_FILE)
+            try:
+                with open(aggregate_path) as fh:
+                    folded = set(json.load(fh).get("folded", ()))
+            except (OSError, ValueError):
+                folded = set()
+            existing = set(self._sample_files())
+            dead = [name for name in dead if name in existing and name not in folded]
+            folded &= existing
+            if dead:
+                counters, histograms = self._read([AGGREGATE_FILE] + dead)
+                self._write(aggregate_path, counters, histograms, folded=sorted(folded | set(dead)))
+                folded |= set(dead)
+            for name in folded:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            if folded:
+                counters, histograms = self._read([AGGREGATE_FILE])
+                self._write(aggregate_path, counters, histograms)
+
+    def _merged(self):
+        with self._directory_lock(exclusive=False):
+            folded = set()
+            try:
+                with open(os.path.join(self.directory, AGGREGATE_FILE)) as fh:
+                    folded = set(json.load(fh).get("folded", ()))
+            except (OSError, ValueError):
+                pass
+            return self._read([name for name in self._sample_files() if name not in folded])
+
+    def render(self):
+        self.flush()
+        self._compact()
+        counters, histograms = self._merged()
+        out = []
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (sample, labels), value in sorted(counters.items()):
+                    if sample == name:
+                        out.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            for (sample, labels), (counts, total) in sorted(histograms.items()):
+                if sample != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    out.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                out.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                out.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(out) + "\n"
+
+
+metrics = Collector()
@@ -0,0 +1,185 @@
+from functools import cached_property
+
+from pdfplumber.table import TableSettings
+
+from layout_cache import inside, layout_fingerprint, padded
+from metrics import metrics
+from spatial_index import SpatialIndex
+
+TABLE_TEXT_SETTINGS = TableSettings.resolve(None).text_settings or {}
+
+
+class PageAnalysis:
+    # With a LayoutCache, tables and label searches on a page whose layout
+    # was seen before are run on crops around the learned boxes. A crop that
+    # does not yield a clean result, or ruling lines outside the learned
+    # table boxes that the layout did not have, fall back to the full page.
+    def __init__(self, page, layouts=None):
+        self.page = page
+        self.layouts = layouts if layouts is not None and layouts.enabled else None
+        self._searches = {}
+        self._char_indexes = {}
+
+    @property
+    def width(self):
+        return self.page.width
+
+    @property
+    def height(self):
+        return self.page.height
+
+    @cached_property
+    def text(self):
+        with metrics.time("extract_text"):
+            return self.page.extract_text() or ""
+
+    @cached_property
+    def lines(self):
+        return self.text.split("\n")
+
+    @cached_property
+    def words(self):
+        with metrics.time("extract_words"):
+            return self.page.extract_words(keep_blank_chars=True)
+
+    @cached_property
+    def chars(self):
+        chars = self.page.chars
+        if chars is None:
+            return []
+        return chars.to_dict("records") if hasattr(chars, "to_dict") else chars
+
+    @cached_property
+    def rects(self):
+        return getattr(self.page, "rects", None) or []
+
+    @cached_property
+    def filled_rects(self):
+        return [rect for rect in self.rects if rect.get("fill", False)]
+
+    @cached_property
+    def filled_rect_index(self):
+        return SpatialIndex(self.filled_rects)
+
+    def char_index(self, texts):
+        key = frozenset(texts)
+        if key not in self._char_indexes:
+            self._char_indexes[key] = SpatialIndex(char for char in self.chars if char.get("text", "") in key)
+        return self._char_indexes[key]
+
+    @cached_property
+    def annots(self):
+        return getattr(self.page, "annots", None) or []
+
+    @cached_property
+    def fingerprint(self):
+        return layout_fingerprint(self.width, self.height, self.chars, self.page.page_number)
+
+    @cached_property
+    def layout(self):
+        if self.layouts is None or self.fingerprint is None:
+            return None
+        return self.layouts.get(self.fingerprint) or {}
+
+    def _learn(self, key, value):
+        if self.layout is not None:
+            self.layouts.learn(self.fingerprint, key, value)
+
+    def _cropped_tables(self, boxes):
+        tables = []
+        for bbox in boxes:
+            crop_bbox = padded(bbox, self.page.bbox)
+            cropped = self.page.crop(crop_bbox)
+            # A ruling line running into the crop edge means the table may
+            # continue beyond the learned box.
+            if not all(inside(_bbox(edge), crop_bbox, self.page.bbox) for edge in cropped.edges):
+                return None
+            found = cropped.find_tables()
+            if len(found) != 1 or not inside(found[0].bbox, crop_bbox, self.page.bbox):
+                return None
+            tables.append(found[0].extract(**TABLE_TEXT_SETTINGS))
+        return tables
+
+    def _stray_edges(self, boxes):
+        # Ruling lines outside every table box, rounded so that the fixed
+        # decorations of a form compare equal from page to page. A table the
+        # learned boxes do not cover shows up here as new lines.
+        crops = [padded(bbox, self.page.bbox) for bbox in boxes]
+        return frozenset(
+            tuple(round(value) for value in _bbox(edge))
+            for edge in self.page.edges
+            if not any(_within(_bbox(edge), crop) for crop in crops)
+        )
+
+    @cached_property
+    def tables(self):
+        with metrics.time("extract_tables"):
+            return self._tables()
+
+    def _tables(self):
+        boxes = self.layout.get("tables") if self.layout else None
+        if boxes is not None:
+            if self._stray_edges(boxes) == self.layout.get("stray_edges"):
+                tables = self._cropped_tables(boxes)
+                if tables is not None:
+                    return tables
+            self.layouts.fallback()
+        found = self.page.find_tables()
+        boxes = [table.bbox for table in found]
+        self._learn("tables", boxes)
+        if self.layout is not None:
+            self._learn("stray_edges", self._stray_edges(boxes))
+        return [table.extract(**TABLE_TEXT_SETTINGS) for table in found]
+
+    def _search(self, pattern):
+        bbox = self.layout.get(("search", pattern)) if self.layout else None
+        if bbox is not None:
+            crop_bbox = padded(bbox, self.page.bbox)
+            hits = self.page.crop(crop_bbox).search(pattern)
+            if hits and inside(_bbox(hits[0]), crop_bbox, self.page.bbox):
+                return hits
+            self.layouts.fallback()
+        hits = self.page.search(pattern)
+        self._learn(("search", pattern), _bbox(hits[0]) if hits else None)
+        return hits
+
+    def search(self, pattern):
+        if pattern not in self._searches:
+            self._searches[pattern] = self._search(pattern)
+        return self._searches[pattern]
+
+
+def _bbox(obj):
+    return (obj["x0"], obj["top"], obj["x1"], obj["bottom"])
+
+
+def _within(bbox, crop_bbox):
+    x0, top, x1, bottom = bbox
+    c_x0, c_top, c_x1, c_bottom = crop_bbox
+    return x0 >= c_x0 and top >= c_top and x1 <= c_x1 and bottom <= c_bottom
+
+
+class DocumentAnalysis:
+    def __init__(self, pdf, layouts=None):
+        self.pdf = pdf
+        self.layouts = layouts
+        self._pages = {}
+
+    def __len__(self):
+        return len(self.pdf.pages)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.page(index)
+
+    def page(self, index):
+        if index not in self._pages:
+            self._pages[index] = PageAnalysis(self.pdf.pages[index], self.layouts)
+            metrics.inc("pdf_pages_processed_total")
+        return self._pages[index]
+
+    def release(self, index):
+        # Drops the page's analysis and pdfplumber's cached objects.
+        analysis = self._pages.pop(index, None)
+        if analysis is not None:
+            analysis.page.close()
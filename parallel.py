@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import Empty
+
+from ingest import open_pdf
+from memory import check_budget
+from metrics import metrics
+from selection import page_indices, selected_pages
+from time_budget import TIMED_OUT, TimeBudget, current_time_budget, guarded, time_budget
+
+# Page-worker processes for the whole host, one per core by default. Every
+# web worker has a pool and forks shards of its own, so each gets an even
+# share rather than all of them.
+PAGE_WORKERS_TOTAL = int(os.environ.get("PAGE_WORKERS_TOTAL", os.cpu_count() or 1))
+WEB_WORKERS = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+MAX_PAGE_WORKERS = int(os.environ.get("MAX_PAGE_WORKERS", max(1, PAGE_WORKERS_TOTAL // WEB_WORKERS)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # A pool whose process died is broken for good; the next task gets a new one.
+    global _executor
+    with _executor_lock:
+        if _executor is not None and getattr(_executor, "_broken", False):
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_PAGE_WORKERS)
+        return _executor
+
+
+def page_shards(page_count, workers):
+    workers = max(1, min(workers, page_count))
+    size, extra = divmod(page_count, workers)
+    shards = []
+    start = 0
+    for i in range(workers):
+        stop = start + size + (1 if i < extra else 0)
+        if stop > start:
+            shards.append((start, stop))
+        start = stop
+    return shards
+
+
+# Seconds between checks that the shard processes of a request are alive.
+SHARD_POLL_SECONDS = 1.0
+
+
+def _run_shard(path, indices, page_fn, page_seconds, queue):
+    # Runs in a process of its own and reports each page as it finishes:
+    # ("page", index, result) or ("timeout", index, None), then
+    # ("done", None, None) or ("error", None, exception). The parent enforces
+    # the request's deadline, the child the per-page limit.
+    try:
+        with open_pdf(path, pages=[index + 1 for index in indices]) as pdf, time_budget(
+            TimeBudget(None, page_seconds)
+        ):
+            for index, page in zip(indices, pdf.pages):
+                result = guarded(index, page_fn, page)
+                page.close()
+                if result is TIMED_OUT:
+                    queue.put(("timeout", index, None))
+                else:
+                    queue.put(("page", index, result))
+        metrics.inc("pdf_pages_processed_total", len(indices))
+        metrics.flush()
+        queue.put(("done", None, None))
+    except BaseException as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError(str(e))
+        queue.put(("error", None, e))
+
+
+def iter_indexed_pages(upload, page_fn, workers=1, pages=None):
+    # Yields (page_index, page_fn(page)) for the pages of an ingested upload
+    # selected by `pages` (page ranges, None for all), in page order. With
+    # workers > 1 the request forks processes of its own, each opening the
+    # upload's file and handling a contiguous run of the selected pages.
+    # Pages that run out of time are left out and recorded on the request's
+    # time budget; when the request's deadline passes, the pages finished by
+    # then are still yielded and only this request's processes are killed.
+    workers = max(1, min(workers, MAX_PAGE_WORKERS))
+    if workers == 1:
+        with open_pdf(upload.stream) as pdf:
+            for index, page in selected_pages(pdf, pages):
+                result = guarded(index, page_fn, page)
+                if result is not TIMED_OUT:
+                    yield index, result
+        return
+
+    path = upload.ensure_path()
+    with open_pdf(path) as pdf:
+        indices = page_indices(pages, len(pdf.pages))
+    shards = [indices[start:stop] for start, stop in page_shards(len(indices), workers)] if indices else []
+    if len(shards) < 2:
+        yield from iter_indexed_pages(upload, page_fn, 1, pages)
+        return
+    budget = current_time_budget()
+    page_seconds = budget.page_seconds if budget is not None else None
+    context = multiprocessing.get_context()
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_run_shard, args=(path, shard, page_fn, page_seconds, queue), daemon=True)
+        for shard in shards
+    ]
+    # index -> result, TIMED_OUT for interrupted pages, until yielded in order.
+    finished = {}
+    running = len(processes)
+
+    def receive(timeout):
+        # Records one message from the shards; False if none came in time.
+        nonlocal running
+        try:
+            kind, index, value = queue.get(timeout=timeout)
+        except Empty:
+            return False
+        if kind == "error":
+            raise value
+        if kind == "done":
+            running -= 1
+        elif kind == "timeout":
+            budget.timed_out.add(index)
+            finished[index] = TIMED_OUT
+        else:
+            finished[index] = value
+        return True
+
+    position = 0
+    try:
+        for process in processes:
+            process.start()
+        while running:
+            remaining = budget.remaining() if budget is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            if not receive(SHARD_POLL_SECONDS if remaining is None else min(remaining, SHARD_POLL_SECONDS)):
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise BrokenProcessPool("A page worker process terminated abruptly")
+                continue
+            while position < len(indices) and indices[position] in finished:
+                index = indices[position]
+                result = finished.pop(index)
+                position += 1
+                if result is not TIMED_OUT:
+                    yield index, result
+                    check_budget()
+        if running:
+            # Out of time: keep every page finished so far, then report the
+            # page each shard was on as timed out and the rest as skipped.
+            while running and receive(0):
+                pass
+            _stop(processes)
+            yielded = set(indices[:position])
+            for shard in shards:
+                pending = [index for index in shard if index not in finished and index not in yielded]
+                if pending:
+                    budget.timed_out.add(pending[0])
+                    budget.skipped.update(pending[1:])
+            for index in indices[position:]:
+                result = finished.get(index, TIMED_OUT)
+                if result is not TIMED_OUT:
+                    yield index, result
+    finally:
+        _stop(processes)
+        queue.close()
+        queue.cancel_join_thread()
+
+
+def _stop(processes):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        if process.pid is not None:
+            process.join()
+
+
+def count_pages(upload, pages=None):
+    with open_pdf(upload.stream) as pdf:
+        return len(page_indices(pages, len(pdf.pages)))
+
+
+def submit_task(fn, *args):
+    return _get_executor().submit(fn, *args)
@@ -0,0 +1,98 @@
+import os
+
+from memory import check_budget
+from metrics import metrics
+from time_budget import skip_if_expired
+
+
+# Decimals coordinates are rounded to when a request does not pass
+# `precision`; unset keeps full float precision.
+COORDINATE_DECIMALS = os.environ.get("COORDINATE_DECIMALS")
+MAX_PRECISION = 6
+
+
+class InvalidSelection(ValueError):
+    pass
+
+
+def parse_page_ranges(spec):
+    # "1-3,7,10-" -> [(1, 3), (7, 7), (10, None)], 1-based and inclusive.
+    # An empty spec selects every page and is returned as None.
+    if spec is None or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, stop = part.partition("-")
+        try:
+            start = int(start) if start.strip() else 1
+            stop = (int(stop) if stop.strip() else None) if sep else start
+        except ValueError:
+            raise InvalidSelection(f"Invalid page range: {part!r}")
+        if start < 1 or (stop is not None and stop < start):
+            raise InvalidSelection(f"Invalid page range: {part!r}")
+        ranges.append((start, stop))
+    return ranges or None
+
+
+def page_indices(ranges, page_count):
+    if ranges is None:
+        return list(range(page_count))
+    indices = set()
+    for start, stop in ranges:
+        stop = page_count if stop is None else min(stop, page_count)
+        indices.update(range(start - 1, stop))
+    return sorted(indices)
+
+
+def selected_pages(pdf, ranges):
+    # Each page's parsed objects are released once the caller moves on to
+    # the next page, so memory follows the largest page, not the document.
+    # Stops before the next page once the request's time budget is spent.
+    indices = page_indices(ranges, len(pdf.pages))
+    for position, index in enumerate(indices):
+        if skip_if_expired(indices[position:]):
+            return
+        metrics.inc("pdf_pages_processed_total")
+        page = pdf.pages[index]
+        yield index, page
+        page.close()
+        check_budget(pdf)
+
+
+def parse_fields(spec, allowed, default):
+    if spec is None or not spec.strip():
+        return frozenset(default)
+    fields = frozenset(field.strip() for field in spec.split(",") if field.strip())
+    unknown = fields - set(allowed)
+    if unknown:
+        raise InvalidSelection(f"Unknown field(s): {', '.join(sorted(unknown))}; expected {', '.join(allowed)}")
+    return fields
+
+
+def parse_precision(spec):
+    # Decimal places to round coordinates to; None keeps full precision.
+    if spec is None or not spec.strip():
+        return None
+    try:
+        decimals = int(spec)
+    except ValueError:
+        decimals = -1
+    if not 0 <= decimals <= MAX_PRECISION:
+        raise InvalidSelection(f"precision must be a whole number from 0 to {MAX_PRECISION}")
+    return decimals
+
+
+def stop_after(items, predicate):
+    # Yields items up to and including the first one matching predicate, then
+    # closes the source so no further pages are extracted.
+    try:
+        for item in items:
+            yield item
+            if predicate(item):
+                return
+    finally:
+        if hasattr(items, "close"):
+            items.close()
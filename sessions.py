@@ -0,0 +1,172 @@
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from ingest import Upload
+
+SESSION_DIR = os.environ.get("SESSION_DIR") or os.path.join(tempfile.gettempdir(), "pdfplumber_sessions")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 1800))
+SESSION_CACHE_MAX_BYTES = int(os.environ.get("SESSION_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+SESSION_DISK_MAX_BYTES = int(os.environ.get("SESSION_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+
+_DOCUMENT_ID = re.compile(r"^[0-9a-f]{32}$")
+# Rough in-memory cost of one cached word dict beyond its text.
+WORD_OVERHEAD_BYTES = 300
+
+
+class UnknownDocument(Exception):
+    def __init__(self, document_id):
+        super().__init__(f"Unknown or expired document: {document_id}")
+
+
+def _size(value):
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, tuple):
+        return sum(_size(item) for item in value)
+    return sum(sys.getsizeof(item.get("text", "")) + WORD_OVERHEAD_BYTES for item in value)
+
+
+class DocumentStore:
+    # Uploaded PDFs are kept as files in `directory`, so any gunicorn worker
+    # can serve any handle. Text and words parsed from their pages are kept
+    # per worker in an LRU bounded by max_bytes. A document expires `ttl`
+    # seconds after it was last used.
+    def __init__(self, directory=SESSION_DIR, ttl=SESSION_TTL, max_bytes=SESSION_CACHE_MAX_BYTES,
+                 disk_max_bytes=SESSION_DISK_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.current_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, document_id):
+        if not document_id or not _DOCUMENT_ID.match(document_id):
+            raise UnknownDocument(document_id)
+        return os.path.join(self.directory, f"{document_id}.pdf")
+
+    def create(self, upload):
+        self.evict_expired()
+        document_id = uuid.uuid4().hex
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            upload.stream.seek(0)
+            with os.fdopen(fd, "wb") as fh:
+                shutil.copyfileobj(upload.stream, fh)
+            os.replace(tmp_path, self._path(document_id))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if self.disk_max_bytes:
+            self._disk_prune()
+        return document_id
+
+    def info(self, document_id):
+        # Touches the document, restarting its TTL.
+        path = self._path(document_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise UnknownDocument(document_id)
+        if time.time() - stat.st_mtime > self.ttl:
+            self.delete(document_id)
+            raise UnknownDocument(document_id)
+        os.utime(path)
+        return {"document_id": document_id, "size": stat.st_size, "expires_in": self.ttl}
+
+    def open(self, document_id):
+        # An Upload over the stored file; closing it leaves the file in place.
+        info = self.info(document_id)
+        with open(self._path(document_id), "rb") as fh:
+            mapping = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return Upload(mapping, info["size"], path=self._path(document_id), owns_path=False)
+
+    def delete(self, document_id):
+        self._forget(document_id)
+        try:
+            os.remove(self._path(document_id))
+        except FileNotFoundError:
+            raise UnknownDocument(document_id)
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".pdf"):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    self._forget(entry.name[:-4])
+            except OSError:
+                continue
+
+    def _disk_prune(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".pdf"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path, entry.name[:-4]))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path, document_id in entries[:-1]:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._forget(document_id)
+            total -= size
+
+    def _forget(self, document_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == document_id]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def page_value(self, document_id, kind, index, compute, page):
+        key = (document_id, kind, index)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+            self.stats["misses"] += 1
+        value = compute(page)
+        size = _size(value)
+        with self._lock:
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (value, size)
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted
+                    self.stats["evictions"] += 1
+        return value
+
+    def page_fn(self, document_id, kind, compute):
+        # compute(page), memoized per page of the document under `kind`.
+        def page_fn(page):
+            return self.page_value(document_id, kind, page.page_number - 1, compute, page)
+
+        return page_fn
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self.current_bytes, max_bytes=self.max_bytes)
@@ -0,0 +1,176 @@
+import os
+
+from form_template import PROTOCOL_DIR, load_template
+from layout_cache import LayoutCache
+from memory import check_budget
+from page_analysis import DocumentAnalysis
+from selection import page_indices
+from time_budget import TIMED_OUT, guarded, skip_if_expired
+
+# Loaded and compiled once per process; SITECHECK_TEMPLATE points at a JSON
+# form description for another protocol variant.
+SITECHECK_TEMPLATE = load_template(
+    os.environ.get("SITECHECK_TEMPLATE") or os.path.join(PROTOCOL_DIR, "sitecheck.json")
+)
+SITECHECK_FIELDS = ("document_header", "site_info", "sections")
+SITECHECK_LAYOUTS = LayoutCache()
+
+
+def _checkbox_status(first_page, status):
+    # Form-field values first, then a marker glyph or a filled box drawn
+    # just left of an option's label.
+    found = None
+    for annot in first_page.annots:
+        if annot.get("data", {}).get("V"):
+            for option in status["options"]:
+                if option in str(annot.get("data", {})):
+                    found = option
+                    break
+    if found:
+        return found
+
+    anchors = []
+    for option in status["options"]:
+        option_words = first_page.search(option)
+        if option_words:
+            anchors.append((option, option_words[0]))
+    positions = [pos for _, pos in anchors]
+    marker_hits = first_page.char_index(status["markers"]).left_of(positions, max_dy=5)
+    for (option, _), hits in zip(anchors, marker_hits):
+        if len(hits):
+            found = option
+    if found:
+        return found
+    rect_hits = first_page.filled_rect_index.left_of(positions)
+    for (option, _), hits in zip(anchors, rect_hits):
+        if len(hits):
+            found = option
+    return found
+
+
+def _filled_option(page, group):
+    anchors = [
+        (label, hits[0]) for label, hits in ((option, page.search(option)) for option in group["options"]) if hits
+    ]
+    rect_hits = page.filled_rect_index.left_of([pos for _, pos in anchors])
+    # The last matching rect on the page decides; the earlier option wins a tie.
+    found = None
+    last_hit = -1
+    for (label, _), hits in zip(anchors, rect_hits):
+        if len(hits) and hits[-1] > last_hit:
+            last_hit = hits[-1]
+            found = label
+    return found
+
+
+def _table_items(template, table, subsection, page_num):
+    if not table or len(table) < 2:
+        return
+    columns = template.table_columns(table[0])
+    if columns is None:
+        return
+    for row in table[1:]:
+        if len(row) < 2:
+            continue
+        item_text = str(row[0]) if row[0] else ""
+        desc_text = str(row[1]) if len(row) > 1 and row[1] else ""
+        full_text = f"{item_text} {desc_text}".strip()
+        item_match = template.item_table["item"].match(full_text)
+        if item_match and item_match.group(1).startswith(subsection["number"] + "."):
+            subsection["items"].append(
+                {
+                    "number": item_match.group(1),
+                    "description": item_match.group(2).strip(),
+                    "status": template.row_status(row, columns),
+                    "page": page_num + 1,
+                }
+            )
+
+
+def parse_sitecheck_protocol(
+    pdf, on_page=None, fields=SITECHECK_FIELDS, pages=None, template=SITECHECK_TEMPLATE, layouts=SITECHECK_LAYOUTS
+):
+    # Only the requested fields are computed: the header and site info come
+    # from the first page alone, so leaving out "sections" skips the rest of
+    # the document. pages limits the section scan to the given page ranges.
+    # Pages out of time budget are left out of the sections.
+    result = {"document_header": {}, "site_info": {}, "sections": []}
+    doc = DocumentAnalysis(pdf, layouts)
+    if len(doc) > 0 and ("document_header" in fields or "site_info" in fields):
+        first_page = doc.page(0)
+        lines = first_page.lines
+
+        if "document_header" in fields:
+            result["document_header"] = template.parse_header(lines)
+
+        if "site_info" in fields:
+            result["site_info"] = template.parse_site_fields(lines)
+            status = _checkbox_status(first_page, template.status)
+            if status:
+                result["site_info"][template.status["key"]] = status
+
+    current_section = None
+    current_subsection = None
+
+    indices = page_indices(pages, len(doc)) if "sections" in fields else []
+    for position, page_num in enumerate(indices):
+        if skip_if_expired(indices[position:]):
+            break
+        if on_page:
+            on_page(position + 1, len(indices))
+        page = doc.page(page_num)
+        lines = guarded(page_num, lambda: page.lines)
+        if lines is TIMED_OUT:
+            doc.release(page_num)
+            continue
+
+        for line_idx, line in enumerate(lines):
+            line = line.strip()
+            hits = template.line_matcher.match(line)
+            if not hits:
+                continue
+
+            if "section" in hits:
+                number, title = hits["section"]
+                current_section = {"number": number, "title": title, "subsections": [], "page": page_num + 1}
+                result["sections"].append(current_section)
+                current_subsection = None
+                continue
+
+            if "subsection" in hits and current_section:
+                number, title = hits["subsection"]
+                current_subsection = {"number": number, "title": title, "items": [], "page": page_num + 1}
+                current_section["subsections"].append(current_subsection)
+                continue
+
+            if not current_subsection:
+                continue
+
+            if "image" in hits:
+                current_subsection.setdefault("images", []).append(line)
+
+            if "required_field" in hits:
+                field_name = line.replace("*", "").strip()
+                if line_idx + 1 < len(lines):
+                    value = lines[line_idx + 1].strip()
+                    if value and not value.endswith("*"):
+                        field_key = field_name.lower().replace(" ", "_").replace("-", "_")
+                        current_subsection[field_key] = value
+
+            for index, group in enumerate(template.checkbox_groups):
+                if index in hits:
+                    checked = template.parse_checkbox_group(
+                        group, lines, line_idx, on_unmarked=lambda group: _filled_option(page, group)
+                    )
+                    if checked:
+                        current_subsection[checked[0]] = checked[1]
+
+        # Tables are only detected on pages where a subsection is open.
+        tables = guarded(page_num, lambda: page.tables) if current_subsection else []
+        if tables is not TIMED_OUT:
+            for table in tables:
+                _table_items(template, table, current_subsection, page_num)
+        doc.release(page_num)
+        check_budget(pdf)
+
+    return {key: value for key, value in result.items() if key in fields}
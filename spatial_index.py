@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class SpatialIndex:
+    # Objects are kept sorted by `top`, so a row band is a searchsorted slice
+    # and the x test is a single vectorized comparison over that slice.
+    def __init__(self, objects):
+        self.objects = list(objects)
+        count = len(self.objects)
+        x0 = np.fromiter((obj.get("x0", 0) for obj in self.objects), dtype=float, count=count)
+        top = np.fromiter((obj.get("top", 0) for obj in self.objects), dtype=float, count=count)
+        self._order = np.argsort(top, kind="stable")
+        self._x0 = x0[self._order]
+        self._top = top[self._order]
+
+    def __len__(self):
+        return len(self.objects)
+
+    def query(self, boxes):
+        # boxes: rows of (x_min, x_max, top_min, top_max), all bounds exclusive.
+        # Returns, per box, the matching object indices in their original order.
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        if not len(boxes):
+            return []
+        starts = np.searchsorted(self._top, boxes[:, 2], side="right")
+        stops = np.searchsorted(self._top, boxes[:, 3], side="left")
+        results = []
+        for (x_min, x_max, _, _), start, stop in zip(boxes, starts, stops):
+            if start >= stop:
+                results.append(np.empty(0, dtype=np.intp))
+                continue
+            x0 = self._x0[start:stop]
+            mask = (x0 > x_min) & (x0 < x_max)
+            results.append(np.sort(self._order[start:stop][mask]))
+        return results
+
+    def left_of(self, anchors, min_gap=5, max_gap=30, max_dy=10):
+        # Objects whose x0 lies between max_gap and min_gap points left of each
+        # anchor's x0 and whose top is within max_dy of the anchor's top.
+        boxes = [
+            (anchor["x0"] - max_gap, anchor["x0"] - min_gap, anchor["top"] - max_dy, anchor["top"] + max_dy)
+            for anchor in anchors
+        ]
+        return self.query(boxes)
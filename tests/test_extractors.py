@@ -0,0 +1,31 @@
+from extractors import extract_all_page, serialize_table
+
+
+def test_records_match_dataframe_records():
+    # What DataFrame(rows, columns=headers).to_dict("records") returned.
+    table = [["Nr", "Name", "Wert"], ["1", "Kabel", "12"], ["2", None, ""]]
+    assert serialize_table(1, table) == {
+        "table_number": 1,
+        "headers": ["Nr", "Name", "Wert"],
+        "data": [{"Nr": "1", "Name": "Kabel", "Wert": "12"}, {"Nr": "2", "Name": "", "Wert": ""}],
+    }
+
+
+def test_duplicate_headers_last_one_wins():
+    table = [["Status", "Wert", "Status", None, None], ["OK", "1", "NOK", "a", "b"]]
+    assert serialize_table(2, table)["data"] == [{"Status": "NOK", "Wert": "1", "": "b"}]
+
+
+def test_header_only_table_has_no_records():
+    assert serialize_table(1, [["Nr", "Name"]])["data"] == []
+
+
+def test_columnar():
+    table = [["Status", None], ["OK", None]]
+    assert serialize_table(3, table, "columnar") == {"table_number": 3, "headers": ["Status", ""], "rows": [["OK", ""]]}
+
+
+def test_columnar_elements_refer_to_tables():
+    tables, elements = extract_all_page("Seite 1", [[["a"], ["b"]], []], "columnar")
+    assert [table["table_number"] for table in tables] == [1]
+    assert elements == [{"type": "text", "content": "Seite 1"}, {"type": "table", "table_number": 1}]
@@ -0,0 +1,125 @@
+import os
+import random
+import re
+
+import pytest
+
+from form_template import PROTOCOL_DIR, LineMatcher, load_template
+
+TEMPLATE = load_template(os.path.join(PROTOCOL_DIR, "sitecheck.json"))
+
+
+def reference_header(lines):
+    # The header loop of the parser before templates.
+    header = {}
+    for line in lines[:10]:
+        line = line.strip()
+        doc_id_match = re.match(r"^(\d{6})\s*-\s*(.+)$", line)
+        if doc_id_match:
+            header["document_id"] = doc_id_match.group(1)
+            header["title"] = doc_id_match.group(2)
+        if "Deutsche Glasfaser" in line:
+            parts = line.split(" - ")
+            header["organization"] = parts[0].strip()
+            if len(parts) > 1:
+                header["note"] = parts[1].strip()
+    return header
+
+
+REFERENCE_SITE_FIELDS = [
+    (r"(\d{4,6})\s*\n\s*Standort\s*\*", "standort"),
+    (r"Record ID:\s*\*\s*\n\s*(\d+)", "record_id"),
+    (r"Datum:\s*\*\s*\n\s*(\d{2}\.\d{2}\.\d{4})", "datum"),
+    (r"POP \(Bundesland\):\s*\*\s*\n\s*([^\n]+)", "pop_bundesland"),
+    (r"POP ID:\s*\*\s*\n\s*([^\n]+)", "pop_id"),
+    (r"POP Typ:\s*\*\s*\n\s*([^\n]+)", "pop_typ"),
+    (r"USV-Typ:\s*\*\s*\n\s*([^\n]+)", "usv_typ"),
+]
+
+
+def reference_site_fields(lines):
+    # One search per field over the page text, as before templates.
+    text = "\n".join(lines)
+    site_info = {}
+    for pattern, key in REFERENCE_SITE_FIELDS:
+        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        if match:
+            site_info[key] = match.group(1).strip()
+    return site_info
+
+
+def reference_match(rules, line, flags=0):
+    found = {}
+    for name, pattern in rules:
+        match = re.search(pattern, line, flags)
+        if match:
+            found[name] = match.groups()
+    return found
+
+
+@pytest.mark.parametrize("ignore_case", [False, True])
+def test_line_matcher_matches_per_rule_search(ignore_case):
+    # Rules with no, one, nested and optional groups check that each rule's
+    # groups are sliced from the right offsets of the combined regex.
+    rules = [
+        ("plain", r"ab"),
+        ("anchored", r"^(\d+)\.\s+(.+)$"),
+        ("nested", r"((a)(b+))c"),
+        ("optional", r"x(y)?z"),
+        ("alternation", r"(foo)|(bar)"),
+        ("end", r"\*$"),
+        ("scoped", r"(?i:^\d+\.jpg$)"),
+    ]
+    matcher = LineMatcher(rules, ignore_case=ignore_case)
+    flags = re.IGNORECASE if ignore_case else 0
+    rng = random.Random(2)
+    fragments = ["ab", "AB", "abbc", "xz", "xyz", "foo", "BAR", "12. Title", "3.jpg", "*", " ", "1", "."]
+    for _ in range(2000):
+        line = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 5)))
+        assert matcher.match(line) == reference_match(rules, line, flags), line
+
+
+def random_first_page(rng):
+    choices = [
+        "123456 - Wartungsprotokoll POP",
+        "12345 - zu kurz",
+        "Deutsche Glasfaser - Intern",
+        "Deutsche Glasfaser",
+        "Standort *",
+        "  standort  *",
+        "Record ID: *",
+        "Datum: *",
+        "POP (Bundesland): *",
+        "POP ID: *",
+        "pop typ: *",
+        "USV-Typ: *",
+        "12345",
+        "1234567",
+        " 4711 ",
+        "01.02.2024",
+        "1.2.2024",
+        "NRW",
+        "POP-17",
+        "",
+        "   ",
+    ]
+    return [rng.choice(choices) for _ in range(rng.randint(0, 25))]
+
+
+def test_header_matches_reference():
+    rng = random.Random(3)
+    for _ in range(2000):
+        lines = random_first_page(rng)
+        assert TEMPLATE.parse_header(lines) == reference_header(lines), lines
+
+
+def test_site_fields_match_reference():
+    rng = random.Random(4)
+    for _ in range(2000):
+        lines = random_first_page(rng)
+        assert TEMPLATE.parse_site_fields(lines) == reference_site_fields(lines), lines
+
+
+def test_whitespace_only_line_is_an_empty_value():
+    lines = ["POP ID: *", "   "]
+    assert TEMPLATE.parse_site_fields(lines) == reference_site_fields(lines) == {"pop_id": ""}
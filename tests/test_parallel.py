@@ -0,0 +1,85 @@
+import io
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import parallel
+from benchmarks.corpus import CORPUS
+from extractors import auto_text, page_artifacts
+from ingest import Upload
+from parallel import iter_indexed_pages
+from time_budget import TimeBudget, time_budget
+
+WORKERS = 3
+
+
+@pytest.fixture(autouse=True)
+def page_workers(monkeypatch):
+    monkeypatch.setattr(parallel, "MAX_PAGE_WORKERS", WORKERS)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return {name: build() for name, (build, _) in CORPUS.items()}
+
+
+def upload(data):
+    return Upload(io.BytesIO(data), len(data))
+
+
+def sleepy_page_number(page):
+    # Pages 1-4 outlast the one-second deadline of the tests below.
+    if page.page_number <= 4:
+        time.sleep(3)
+    return page.page_number
+
+
+def crash(page):
+    os._exit(9)
+
+
+def fail(page):
+    raise ValueError(f"bad page {page.page_number}")
+
+
+@pytest.mark.parametrize("name", sorted(CORPUS))
+@pytest.mark.parametrize("page_fn", [auto_text, page_artifacts])
+def test_sharded_matches_sequential(corpus, name, page_fn):
+    sequential = list(iter_indexed_pages(upload(corpus[name]), page_fn, 1))
+    assert list(iter_indexed_pages(upload(corpus[name]), page_fn, WORKERS)) == sequential
+
+
+def test_page_selection(corpus):
+    pages = [(2, 3), (7, None)]
+    sequential = list(iter_indexed_pages(upload(corpus["text"]), auto_text, 1, pages))
+    assert [index for index, _ in sequential] == [1, 2, 6, 7, 8, 9, 10, 11]
+    assert list(iter_indexed_pages(upload(corpus["text"]), auto_text, WORKERS, pages)) == sequential
+
+
+def test_deadline_keeps_finished_pages(corpus):
+    # Three shards of four pages: the first is stuck on page 1 past the
+    # deadline, the others finish theirs.
+    started = time.monotonic()
+    with time_budget(TimeBudget(1, 30)) as budget:
+        results = list(iter_indexed_pages(upload(corpus["text"]), sleepy_page_number, WORKERS))
+    assert time.monotonic() - started < 2.5
+    assert results == [(index, index + 1) for index in range(4, 12)]
+    assert budget.report() == {"skipped_pages": [2, 3, 4], "timed_out_pages": [1]}
+
+
+def test_page_error_is_raised(corpus):
+    with pytest.raises(ValueError, match="bad page"):
+        list(iter_indexed_pages(upload(corpus["text"]), fail, WORKERS))
+
+
+def test_crashed_shard_raises_broken_pool(corpus):
+    with time_budget(TimeBudget(10, 30)), pytest.raises(BrokenProcessPool):
+        list(iter_indexed_pages(upload(corpus["text"]), crash, WORKERS))
+
+
+def test_early_close_stops_shards(corpus):
+    gen = iter_indexed_pages(upload(corpus["text"]), auto_text, WORKERS)
+    assert next(gen)[0] == 0
+    gen.close()
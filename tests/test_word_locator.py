@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from word_locator import WordMatcher, _Automaton, page_header, page_word_locations
+
+
+def reference_locations(page_num, words, targets):
+    # The per-target scans WordMatcher replaced.
+    word_texts = [w["text"].strip() for w in words]
+    word_texts_lower = [w.lower() for w in word_texts]
+
+    def location(first, last, text):
+        return {
+            "page": page_num,
+            "text": text,
+            "x0": float(first["x0"]),
+            "y0": float(first["top"]),
+            "x1": float(last["x1"]),
+            "y1": float(last["bottom"]),
+        }
+
+    found = []
+    for target in targets:
+        target_words = [tw.strip() for tw in target.strip().lower().split()]
+        if not target_words:
+            continue
+        if len(target_words) == 1:
+            for i, w in enumerate(word_texts_lower):
+                if target_words[0] in w:
+                    found.append(location(words[i], words[i], words[i]["text"]))
+        else:
+            joined_target = " ".join(target_words)
+            for i, w in enumerate(word_texts_lower):
+                if w == joined_target:
+                    found.append(location(words[i], words[i], words[i]["text"]))
+            size = len(target_words)
+            for i in range(len(word_texts_lower) - size + 1):
+                if word_texts_lower[i : i + size] == target_words:
+                    found.append(location(words[i], words[i + size - 1], " ".join(word_texts[i : i + size])))
+    return found
+
+
+def make_words(texts):
+    return [
+        {"text": text, "x0": 10.0 * i, "top": 2.0 * i, "x1": 10.0 * i + 8.5, "bottom": 2.0 * i + 1.25}
+        for i, text in enumerate(texts)
+    ]
+
+
+def random_token(rng, alphabet="abAB"):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+
+
+@pytest.mark.parametrize("patterns", [["he", "she", "his", "hers"], ["a", "aa", "aaa"], ["abc", "bc", "c", "bcd"]])
+def test_automaton_known_overlaps(patterns):
+    automaton = _Automaton(patterns)
+    for text in ["ushers", "aaaa", "xabcd", "", "hishe"]:
+        assert automaton.search(text) == {i for i, p in enumerate(patterns) if p in text}
+
+
+def test_automaton_matches_substring_search():
+    # A small alphabet makes patterns share prefixes and suffixes, so the
+    # failure links and inherited outputs are exercised.
+    rng = random.Random(0)
+    for _ in range(500):
+        patterns = list({random_token(rng, "ab") for _ in range(rng.randint(1, 8))})
+        automaton = _Automaton(patterns)
+        for _ in range(10):
+            text = "".join(rng.choice("abc") for _ in range(rng.randint(0, 12)))
+            assert automaton.search(text) == {i for i, p in enumerate(patterns) if p in text}
+
+
+def test_word_matcher_matches_reference():
+    rng = random.Random(1)
+    for _ in range(300):
+        texts = [random_token(rng) for _ in range(rng.randint(0, 30))]
+        # Some words with inner or surrounding spaces, as keep_blank_chars yields.
+        texts += [" ".join(random_token(rng) for _ in range(2)) for _ in range(rng.randint(0, 3))]
+        texts += [f" {random_token(rng)} " for _ in range(rng.randint(0, 2))]
+        rng.shuffle(texts)
+        words = make_words(texts)
+        targets = [
+            " ".join(random_token(rng) for _ in range(rng.choice((1, 1, 2, 3)))) for _ in range(rng.randint(1, 6))
+        ]
+        targets += rng.sample(["", "   ", targets[0], targets[0].upper()], 2)
+        assert page_word_locations(3, words, WordMatcher(targets)) == reference_locations(3, words, targets)
+
+
+def test_blank_targets_are_ignored():
+    words = make_words(["Max", "Mustermann"])
+    assert page_word_locations(0, words, WordMatcher(["", "  "])) == []
+
+
+def test_decimals_round_coordinates():
+    words = [{"text": "Berlin", "x0": 1.23456, "top": 2.5, "x1": 3.98765, "bottom": 4.0}]
+    (location,) = page_word_locations(0, words, WordMatcher(["berlin"]), decimals=2)
+    assert (location["x0"], location["y0"], location["x1"], location["y1"]) == (1.23, 2.5, 3.99, 4.0)
+
+
+def test_page_header():
+    class Page:
+        width = 595.2756
+        height = 841.8898
+
+    assert page_header(1, Page()) == {"page": 1, "width": 595.2756, "height": 841.8898}
+    assert page_header(1, Page(), decimals=1) == {"page": 1, "width": 595.3, "height": 841.9}
@@ -0,0 +1,166 @@
+import contextvars
+import ctypes
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Wall-clock limits for a request and for any single page in it; 0 disables.
+# Past the request limit no further pages are started; a page running past
+# its limit is interrupted by the watchdog. Either way the response carries
+# the pages finished so far and lists the rest.
+REQUEST_TIME_BUDGET_SECONDS = float(os.environ.get("REQUEST_TIME_BUDGET_SECONDS", 120))
+PAGE_TIME_BUDGET_SECONDS = float(os.environ.get("PAGE_TIME_BUDGET_SECONDS", 30))
+
+# Returned by guarded() in place of the result of an interrupted page.
+TIMED_OUT = object()
+
+
+class PageTimeout(BaseException):
+    # Raised asynchronously inside pdfplumber/pdfminer code, whose
+    # `except Exception` handlers would otherwise wrap or swallow it.
+    pass
+
+
+class TimeBudget:
+    def __init__(self, seconds=REQUEST_TIME_BUDGET_SECONDS, page_seconds=PAGE_TIME_BUDGET_SECONDS):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.page_seconds = page_seconds or None
+        self.skipped = set()
+        self.timed_out = set()
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def page_limit(self):
+        limits = [limit for limit in (self.page_seconds, self.remaining()) if limit is not None]
+        return min(limits) if limits else None
+
+    def report(self):
+        # 1-based page numbers, like the rest of the responses.
+        report = {}
+        if self.skipped:
+            report["skipped_pages"] = sorted(index + 1 for index in self.skipped)
+        if self.timed_out:
+            report["timed_out_pages"] = sorted(index + 1 for index in self.timed_out)
+        return report
+
+
+def _raise_in(ident, exc_type):
+    # None clears an exception that was set but not yet raised.
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(ident), ctypes.py_object(exc_type) if exc_type is not None else None
+    )
+
+
+class Watchdog:
+    # One thread per process that raises PageTimeout in threads whose page
+    # runs past its limit. The exception lands at the next Python bytecode,
+    # so a page stuck inside a single C call is only stopped once it returns.
+    def __init__(self):
+        self._reset()
+        # A forked child has no watchdog thread and may have copied a held lock.
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._entries = {}
+        self._started = False
+
+    def _ensure_thread(self):
+        if not self._started:
+            self._started = True
+            threading.Thread(target=self._run, name="page-watchdog", daemon=True).start()
+
+    def _run(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                pending = []
+                for ident, entry in self._entries.items():
+                    if entry[1]:
+                        continue
+                    if entry[0] <= now:
+                        entry[1] = True
+                        _raise_in(ident, PageTimeout)
+                    else:
+                        pending.append(entry[0])
+                self._cond.wait(min(pending) - now if pending else None)
+
+    @contextmanager
+    def limit(self, seconds):
+        ident = threading.get_ident()
+        entry = [time.monotonic() + seconds, False]
+        with self._cond:
+            self._ensure_thread()
+            self._entries[ident] = entry
+            self._cond.notify()
+        try:
+            yield
+        finally:
+            with self._cond:
+                if self._entries.get(ident) is entry:
+                    del self._entries[ident]
+                if entry[1]:
+                    _raise_in(ident, None)
+
+
+watchdog = Watchdog()
+
+_budget = contextvars.ContextVar("time_budget", default=None)
+
+
+def start_time_budget():
+    _budget.set(TimeBudget())
+
+
+def end_time_budget():
+    _budget.set(None)
+
+
+def current_time_budget():
+    return _budget.get()
+
+
+@contextmanager
+def time_budget(budget):
+    # Makes `budget` current, e.g. again for a body streamed after teardown.
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+def skip_if_expired(indices):
+    # Called before each page with the pages still to do; once the request
+    # is out of time they are recorded as skipped and True is returned.
+    budget = _budget.get()
+    if budget is None or not budget.expired():
+        return False
+    budget.skipped.update(indices)
+    return True
+
+
+def guarded(index, fn, *args):
+    # fn(*args) under the page watchdog; TIMED_OUT if it was interrupted.
+    budget = _budget.get()
+    limit = budget.page_limit() if budget is not None else None
+    if limit is None:
+        return fn(*args)
+    try:
+        with watchdog.limit(limit):
+            return fn(*args)
+    except PageTimeout:
+        budget.timed_out.add(index)
+        return TIMED_OUT
+
+
+def time_budget_report():
+    budget = _budget.get()
+    return budget.report() if budget is not None else {}
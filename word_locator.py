@@ -0,0 +1,129 @@
+from collections import defaultdict, deque
+
+
+class _Automaton:
+    # Aho-Corasick automaton: finds every pattern occurring in a text in a
+    # single pass over its characters.
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [frozenset()]
+        outputs = [set()]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    outputs.append(set())
+                state = nxt
+            outputs[state].add(pattern_id)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0)
+                outputs[nxt] |= outputs[self.fail[nxt]]
+        self.out = [frozenset(found) for found in outputs]
+
+    def search(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        found = set()
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class WordMatcher:
+    # Compiled once per request and reused for every page. Single-word
+    # targets match any word containing them; multi-word targets match a
+    # word equal to the whole phrase or a run of consecutive words equal to
+    # its tokens. match() reproduces the target-by-target ordering of the
+    # original per-target scans.
+    def __init__(self, targets):
+        self.targets = []
+        substrings = []
+        substring_ids = {}
+        for target in targets:
+            target_words = [tw.strip() for tw in target.strip().lower().split()]
+            if not target_words:
+                continue
+            if len(target_words) == 1:
+                if target_words[0] not in substring_ids:
+                    substring_ids[target_words[0]] = len(substrings)
+                    substrings.append(target_words[0])
+                self.targets.append((substring_ids[target_words[0]], target_words))
+            else:
+                self.targets.append((None, target_words))
+        self._automaton = _Automaton(substrings) if substrings else None
+
+    def match(self, word_texts_lower):
+        # Returns (start, stop) spans over the word list.
+        substring_hits = defaultdict(list)
+        if self._automaton is not None:
+            seen = {}
+            for i, word in enumerate(word_texts_lower):
+                if word not in seen:
+                    seen[word] = self._automaton.search(word)
+                for pattern_id in seen[word]:
+                    substring_hits[pattern_id].append(i)
+
+        positions = None
+        spans = []
+        for pattern_id, target_words in self.targets:
+            if pattern_id is not None:
+                spans.extend((i, i + 1) for i in substring_hits.get(pattern_id, ()))
+                continue
+            if positions is None:
+                positions = defaultdict(list)
+                for i, word in enumerate(word_texts_lower):
+                    positions[word].append(i)
+            joined_target = " ".join(target_words)
+            spans.extend((i, i + 1) for i in positions.get(joined_target, ()))
+            size = len(target_words)
+            for i in positions.get(target_words[0], ()):
+                if word_texts_lower[i : i + size] == target_words:
+                    spans.append((i, i + size))
+        return spans
+
+
+def _round(value, decimals):
+    return float(value) if decimals is None else round(float(value), decimals)
+
+
+def page_header(page_num, page, decimals=None):
+    # Page size, sent once per page with hits rather than in every location.
+    return {"page": page_num, "width": _round(page.width, decimals), "height": _round(page.height, decimals)}
+
+
+def page_word_locations(page_num, words, matcher, decimals=None):
+    word_texts = [w["text"].strip() for w in words]
+    word_texts_lower = [w.lower() for w in word_texts]
+    found = []
+    for start, stop in matcher.match(word_texts_lower):
+        first = words[start]
+        last = words[stop - 1]
+        found.append(
+            {
+                "page": page_num,
+                "text": first["text"] if stop - start == 1 else " ".join(word_texts[start:stop]),
+                "x0": _round(first["x0"], decimals),
+                "y0": _round(first["top"], decimals),
+                "x1": _round(last["x1"], decimals),
+                "y1": _round(last["bottom"], decimals),
+            }
+        )
+    return found